@@ -8,6 +8,40 @@ price updates from Zubicks website. """
 
 """ CHANGE LOG
 
+Monday October 19, 2026
+    Added price alert rules (threshold, percent change, moving average crossover,
+    new high and new low) evaluated against newly inserted prices at update time.
+    Alerts are shown as desktop notifications, or printed in headless mode.
+    Added command line commands "update" and "alerts" for headless operation.
+    Added a type-ahead material search entry backed by an SQLite FTS5 index with
+    a synonym table.  The index is updated when new materials appear in an update.
+    Added an optional JSON query server bound to localhost, with a read only
+    connection pool, an LRU response cache cleared by price updates, ETags and gzip.
+    The server is started from the Tools menu or with the "serve" command.
+    Added a cross yard comparison window showing the best price paid for each
+    material in each yard's latest update, ranked per unit, and the spread between
+    yards over time.  A LATEST_PRICES table is
+    kept up to date at update time, and MATERIAL_EQUIVALENTS maps each yard's
+    material names to a common name.
+    Added technical indicator overlays (moving averages, min/max band, volatility
+    and year over year change) that can be toggled on the price graph.  Indicators
+    are computed with NumPy in zsa_analytics.py and cached until the next update.
+    Added yearly archive partitions.  The "seal" command moves the prices of the
+    oldest finished year into its own database file in ARCHIVE_DIR, and price
+    queries attach only the archive files overlapping the requested date range.
+    Added a unit registry in zsa_units.py.  Updates now store each price as quoted
+    and per kilogram alongside the price per pound.  Prices can be displayed per
+    pound, kilogram, net tonne, metric tonne or gross ton in the price list and
+    the price graph, and a unit converter window is under the Tools menu.
+    Added validation of price updates.  Malformed rows are rejected, and sudden
+    jumps, unusual changes and materials missing since the previous update are
+    recorded in PRICE_ANOMALIES and reported.  The "scan" command checks the
+    whole database in chunks.
+    Price updates now look up each yard's price list page in YARD_URLS and store
+    prices under the yard being updated.  Added zsa_loadtest.py, which replays a
+    year of updates from a local fake yard server and measures ingest throughput,
+    reader lock contention and database growth.
+
 Monday July 3, 2023
     Fixed bug where buttons expand when window is maximized.
     Implemented daterange filter function.  The scrolled window now filters data display
@@ -40,8 +74,6 @@ some SQL queries to add WHERE YARD = Selected_Yard clause.
 
 Add column to SQLite database to show price change from previous date.
 
-Add unit conversion of masses in a separate window under Tools menu.
-
 """
 
 import gi
@@ -59,19 +91,97 @@ from pprint import pformat
 import bs4 as bs
 import urllib.request
 import sqlite3
+import argparse
+import difflib
+import re
+import collections
+import math
+import gzip
+import hashlib
+import http.server
+import json
+import queue
+import threading
+import urllib.parse
 import os
 import sys
 
 import matplotlib.pyplot
 import matplotlib.dates
 import matplotlib.ticker
+import matplotlib.widgets
+
+import zsa_analytics
+import zsa_units
 
 # Global constants
 
 # change to suit your system
 BASE_DIR = '/home/john/Desktop/ZSAPresentation/'
 DB_FILE = BASE_DIR+'zubicksprices.db'
-POUNDS_PER_NET_TONNE = 2000
+# sealed years of prices are moved to one database file per year in ARCHIVE_DIR
+ARCHIVE_DIR = BASE_DIR+'archive/'
+ARCHIVE_FILE_PATTERN = re.compile(r'^zubicksprices_(\d{4})\.db$')
+APPLICATION_ID = 'com.zubicks.ZubicksScrapApp'
+
+# price list page of each scrap yard
+YARD_URLS = {
+    "Zubicks": 'https://www.zubicks.com/prices/',
+}
+URL_TIMEOUT = 60                    # seconds to wait for a price list page
+
+# number of recent prices kept per yard and material for alert rules
+ALERT_HISTORY_LENGTH = 50
+ALERT_RULE_TYPES = ["threshold", "percent_change", "ma_crossover", "new_high", "new_low"]
+
+# JSON query server settings
+QUERY_SERVER_HOST = '127.0.0.1'
+QUERY_SERVER_PORT = 8642
+QUERY_POOL_SIZE = 4
+QUERY_CACHE_SIZE = 256
+# SQL expressions grouping datestamps into rollup periods
+ROLLUP_PERIODS = {
+    "week": "strftime('%Y-W%W', DATESTAMP)",
+    "month": "substr(DATESTAMP, 1, 7)",
+    "year": "substr(DATESTAMP, 1, 4)",
+}
+
+# days a yard's price is carried forward in price spreads without an update
+SPREAD_MAX_AGE_DAYS = 60
+
+# price validation settings
+VALIDATION_HISTORY_LENGTH = 20      # recent prices used for change statistics
+VALIDATION_MIN_HISTORY = 5          # fewer recent prices than this skips the z-score check
+VALIDATION_MIN_SIGMA = 0.05         # smallest standard deviation of log price changes used
+VALIDATION_Z_SCORE = 6.0            # z-scores of price changes above this are suspicious
+VALIDATION_JUMP_PERCENT = 50.0      # price changes above this percentage are suspicious
+VALIDATION_MAX_PRICE = 1000.0       # highest believable price per pound
+VALIDATION_MAX_NAME_LENGTH = 100    # longest believable material name
+SCAN_CHUNK_SIZE = 5000              # rows read at a time by the database scan
+
+# maximum number of ranked material search completions
+SEARCH_RESULT_LIMIT = 50
+# search terms and the words they should also match in material names
+DEFAULT_MATERIAL_SYNONYMS = [
+    ("cu", "copper"),
+    ("al", "aluminum"),
+    ("alu", "aluminum"),
+    ("aluminium", "aluminum"),
+    ("ss", "304"),
+    ("ss", "316"),
+    ("stainless", "304"),
+    ("stainless", "316"),
+    ("stainless", "400"),
+    ("bare", "bright"),
+    ("ubc", "cans"),
+    ("rad", "radiators"),
+    ("rads", "radiators"),
+    ("tranny", "transmissions"),
+    ("fe", "iron"),
+    ("pb", "lead"),
+    ("zn", "zinc"),
+    ("mg", "magnesium"),
+]
 
 CENT_SIGN = '\u00A2' # unicode character for cent symbol
 
@@ -129,47 +239,468 @@ def create_database():
                           MATERIAL CHAR(40) NOT NULL,
                           PRICE REAL NOT NULL,
                           UNIT CHAR(5),
-                          DATESTAMP TEXT);''')
+                          DATESTAMP TEXT,
+                          ORIGINAL_PRICE REAL,
+                          ORIGINAL_UNIT CHAR(5),
+                          PRICE_PER_KG REAL);''')
 
     connection.commit()
     connection.close()
 
+def add_unit_columns(connection):
+    """ Adds the price as quoted and the price per kilogram to PRICES tables
+    created by earlier versions, and fills them in for mass units. """
+    column_names = [row[1] for row in connection.execute("PRAGMA table_info(PRICES)")]
+    if "PRICE_PER_KG" in column_names:
+        return
+    connection.execute("ALTER TABLE PRICES ADD COLUMN ORIGINAL_PRICE REAL")
+    connection.execute("ALTER TABLE PRICES ADD COLUMN ORIGINAL_UNIT CHAR(5)")
+    connection.execute("ALTER TABLE PRICES ADD COLUMN PRICE_PER_KG REAL")
+    for unit in zsa_units.MASS_UNITS:
+        connection.execute('''UPDATE PRICES SET ORIGINAL_PRICE=PRICE, ORIGINAL_UNIT=?, PRICE_PER_KG=PRICE*?
+                              WHERE TRIM(UNIT)=?''', (unit, zsa_units.price_factor(unit, "kg"), unit))
+    connection.execute('''UPDATE PRICES SET ORIGINAL_PRICE=PRICE, ORIGINAL_UNIT=TRIM(UNIT)
+                          WHERE ORIGINAL_PRICE IS NULL''')
+
+def prepare_database(connection):
+    """ Creates columns, indexes and support tables missing from older database files. """
+    add_unit_columns(connection)
+    connection.execute('''CREATE INDEX IF NOT EXISTS PRICES_YARD_MATERIAL_DATE
+                          ON PRICES (YARD, MATERIAL, DATESTAMP)''')
+    connection.execute('''CREATE INDEX IF NOT EXISTS PRICES_MATERIAL_DATE
+                          ON PRICES (MATERIAL, DATESTAMP)''')
+    connection.execute('''CREATE INDEX IF NOT EXISTS PRICES_YARD_DATE
+                          ON PRICES (YARD, DATESTAMP)''')
+    connection.execute('''CREATE TABLE IF NOT EXISTS ALERT_RULES (ID INTEGER PRIMARY KEY,
+                          YARD CHAR(20) NOT NULL,
+                          MATERIAL CHAR(40) NOT NULL,
+                          RULE_TYPE CHAR(20) NOT NULL,
+                          VALUE REAL,
+                          LONG_WINDOW INTEGER)''')
+    # rolling state per yard and material, so rules never rescan the price history
+    connection.execute('''CREATE TABLE IF NOT EXISTS ALERT_STATE (YARD CHAR(20) NOT NULL,
+                          MATERIAL CHAR(40) NOT NULL,
+                          LAST_PRICE REAL,
+                          LAST_DATESTAMP TEXT,
+                          HIGH_PRICE REAL,
+                          LOW_PRICE REAL,
+                          RECENT_PRICES TEXT,
+                          PRIMARY KEY (YARD, MATERIAL))''')
+    connection.execute('''CREATE TABLE IF NOT EXISTS PRICE_ANOMALIES (YARD CHAR(20) NOT NULL,
+                          MATERIAL CHAR(40),
+                          DATESTAMP TEXT,
+                          KIND CHAR(20) NOT NULL,
+                          DETAIL TEXT)''')
+    build_material_index(connection)
+    build_latest_prices(connection)
+    connection.commit()
+
+def build_latest_prices(connection):
+    """ Creates the latest price and material equivalence tables used to compare
+    yards, and fills the latest price table from PRICES when it is empty. """
+    connection.execute('''CREATE TABLE IF NOT EXISTS LATEST_PRICES (YARD CHAR(20) NOT NULL,
+                          MATERIAL CHAR(40) NOT NULL,
+                          PRICE REAL NOT NULL,
+                          UNIT CHAR(5),
+                          DATESTAMP TEXT,
+                          PRIMARY KEY (YARD, MATERIAL))''')
+    # maps a yard's name for a material to the name shared by all yards
+    connection.execute('''CREATE TABLE IF NOT EXISTS MATERIAL_EQUIVALENTS (YARD CHAR(20) NOT NULL,
+                          MATERIAL CHAR(40) NOT NULL,
+                          CANONICAL CHAR(40) NOT NULL,
+                          PRIMARY KEY (YARD, MATERIAL))''')
+    connection.execute('''CREATE INDEX IF NOT EXISTS MATERIAL_EQUIVALENTS_CANONICAL
+                          ON MATERIAL_EQUIVALENTS (CANONICAL)''')
+
+    if connection.execute("SELECT COUNT(*) FROM LATEST_PRICES").fetchone()[0] == 0:
+        connection.execute('''INSERT INTO LATEST_PRICES
+                              SELECT YARD, MATERIAL, PRICE, UNIT, DATESTAMP FROM PRICES P
+                              WHERE DATESTAMP = (SELECT MAX(DATESTAMP) FROM PRICES
+                                                 WHERE YARD=P.YARD AND MATERIAL=P.MATERIAL)
+                              GROUP BY YARD, MATERIAL''')
+
+def update_latest_prices(connection, records):
+    """ Stores newly inserted price records in the latest price table. """
+    connection.executemany('''INSERT INTO LATEST_PRICES VALUES (?,?,?,?,?)
+                              ON CONFLICT (YARD, MATERIAL) DO UPDATE
+                              SET PRICE=excluded.PRICE, UNIT=excluded.UNIT, DATESTAMP=excluded.DATESTAMP
+                              WHERE excluded.DATESTAMP >= LATEST_PRICES.DATESTAMP''', records)
+
+def set_material_equivalent(connection, yard, material, canonical):
+    """ Maps a yard's material name to the common material name canonical. """
+    connection.execute("INSERT OR REPLACE INTO MATERIAL_EQUIVALENTS VALUES (?,?,?)",
+                       (yard, material, canonical))
+    connection.commit()
+
+def remove_material_equivalent(connection, yard, material):
+    """ Removes the common name mapping of a yard's material name. """
+    connection.execute("DELETE FROM MATERIAL_EQUIVALENTS WHERE YARD=? AND MATERIAL=?", (yard, material))
+    connection.commit()
+
+def normalize_material_name(name):
+    """ Returns lower case words of a material name or search string,
+    with punctuation removed so "#1 Bright Copper" gives "1 bright copper". """
+    name = name.lower().replace('\u2019', '').replace("'", '')
+    return ' '.join(re.findall(r'[a-z0-9]+', name))
+
+def build_material_index(connection):
+    """ Creates the material search index and synonym table, and fills the
+    index from the PRICES table when it is empty. """
+    connection.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS MATERIAL_SEARCH
+                          USING fts5(MATERIAL UNINDEXED, TERMS, prefix='1 2 3')''')
+    connection.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS MATERIAL_SEARCH_VOCAB
+                          USING fts5vocab(MATERIAL_SEARCH, 'row')''')
+    connection.execute('''CREATE TABLE IF NOT EXISTS MATERIAL_SYNONYMS (TERM CHAR(20) NOT NULL,
+                          SYNONYM CHAR(40) NOT NULL,
+                          PRIMARY KEY (TERM, SYNONYM))''')
+    connection.executemany("INSERT OR IGNORE INTO MATERIAL_SYNONYMS VALUES (?,?)",
+                           DEFAULT_MATERIAL_SYNONYMS)
+
+    if connection.execute("SELECT COUNT(*) FROM MATERIAL_SEARCH").fetchone()[0] == 0:
+        cursor = connection.execute("SELECT DISTINCT MATERIAL FROM PRICES")
+        update_material_index(connection, [row[0] for row in cursor])
+
+def update_material_index(connection, materials):
+    """ Adds materials missing from the material search index. """
+    indexed = set(row[0] for row in connection.execute("SELECT MATERIAL FROM MATERIAL_SEARCH"))
+    for material in sorted(set(materials) - indexed):
+        connection.execute("INSERT INTO MATERIAL_SEARCH (MATERIAL, TERMS) VALUES (?,?)",
+                           (material, normalize_material_name(material)))
+
+def material_match_query(connection, words):
+    """ Builds an FTS5 query matching every word as a prefix, or any of its synonyms. """
+    clauses = []
+    for word in words:
+        alternatives = [word]
+        cursor = connection.execute("SELECT SYNONYM FROM MATERIAL_SYNONYMS WHERE TERM=?", (word,))
+        alternatives.extend(normalize_material_name(row[0]) for row in cursor)
+        clauses.append('(' + ' OR '.join('"' + alternative + '"*' for alternative in alternatives) + ')')
+    return ' AND '.join(clauses)
+
+def search_materials(connection, search_str, limit=SEARCH_RESULT_LIMIT):
+    """ Returns up to limit material names matching search_str, best matches
+    first, or every match when limit is None.  Misspelled words are replaced
+    by the closest words in the index. """
+    words = normalize_material_name(search_str).split()
+    if not words:
+        return []
+    if limit is None:
+        limit = -1              # no limit in SQLite
+
+    query = '''SELECT MATERIAL FROM MATERIAL_SEARCH WHERE MATERIAL_SEARCH MATCH ?
+               ORDER BY bm25(MATERIAL_SEARCH), MATERIAL LIMIT ?'''
+    materials = [row[0] for row in connection.execute(query, (material_match_query(connection, words), limit))]
+    if materials:
+        return materials
+
+    # no exact or prefix matches, so try the closest indexed words instead
+    vocabulary = [row[0] for row in connection.execute("SELECT term FROM MATERIAL_SEARCH_VOCAB")]
+    corrected = []
+    for word in words:
+        matches = difflib.get_close_matches(word, vocabulary, n=1, cutoff=0.7)
+        corrected.append(matches[0] if matches else word)
+    if corrected == words:
+        return []
+    return [row[0] for row in connection.execute(query, (material_match_query(connection, corrected), limit))]
+
+def check_datestamp(datestamp):
+    """ Returns a description of what is wrong with datestamp, or None when it is
+    a valid date that is not in the future. """
+    try:
+        stamp_date = datetime.strptime(datestamp, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return "invalid datestamp " + repr(datestamp)
+    if datestamp != stamp_date.strftime("%Y-%m-%d"):
+        return "invalid datestamp " + repr(datestamp)
+    if stamp_date > date.today() + timedelta(days=1):
+        return "datestamp " + datestamp + " is in the future"
+    return None
+
+def check_price_record(yard, material, price, unit, datestamp):
+    """ Returns a description of what is wrong with a price record, or None. """
+    if not material or not material.strip():
+        return "missing material name"
+    if len(material) > VALIDATION_MAX_NAME_LENGTH:
+        return "material name longer than " + str(VALIDATION_MAX_NAME_LENGTH) + " characters"
+    if not isinstance(price, float) or math.isnan(price) or math.isinf(price):
+        return "price is not a number"
+    if price <= 0:
+        return "price is not positive"
+    if zsa_units.unit_key(unit) is None:
+        return "unknown unit " + repr(unit)
+    if zsa_units.is_mass_unit(unit) and zsa_units.convert_price(price, unit, "lb") > VALIDATION_MAX_PRICE:
+        return "price over " + currencytostr(VALIDATION_MAX_PRICE).strip() + " per pound"
+    return check_datestamp(datestamp)
+
+def check_price_change(history, price):
+    """ Compares price with the recent prices in history, oldest first.
+    Returns a list of (kind, detail) pairs for a sudden jump or a change with
+    an unusual z-score compared with recent log price changes. """
+    if not history or history[-1] <= 0:
+        return []
+    anomalies = []
+    last_price = history[-1]
+    change = (price - last_price) / last_price * 100
+    if abs(change) >= VALIDATION_JUMP_PERCENT:
+        anomalies.append(("jump", "changed {:+.1f}% from {}".format(change, currencytostr(last_price).strip())))
+
+    if len(history) >= VALIDATION_MIN_HISTORY:
+        changes = [math.log(history[index] / history[index - 1]) for index in range(1, len(history))]
+        average = mean(changes)
+        sigma = max(math.sqrt(mean([(item - average) ** 2 for item in changes])), VALIDATION_MIN_SIGMA)
+        z_score = (math.log(price / last_price) - average) / sigma
+        if abs(z_score) >= VALIDATION_Z_SCORE:
+            anomalies.append(("z-score", "change z-score {:+.1f} against the last {} prices".format(z_score, len(history))))
+    return anomalies
+
+def recent_price_histories(connection, yard, materials, datestamp):
+    """ Returns a dictionary of up to VALIDATION_HISTORY_LENGTH prices of each of
+    a yard's materials before datestamp, oldest first.  Each partition is read
+    once for all the materials, newest first, and archives only while some
+    material has too few prices.  Must run before an update's inserts. """
+    histories = dict((material, []) for material in materials)
+    sql = '''SELECT MATERIAL, PRICE FROM
+             (SELECT MATERIAL, PRICE, DATESTAMP,
+                     ROW_NUMBER() OVER (PARTITION BY MATERIAL ORDER BY DATESTAMP DESC) AS POSITION
+              FROM {prices} WHERE YARD=? AND DATESTAMP<? AND MATERIAL IN ({materials}))
+             WHERE POSITION<=? ORDER BY MATERIAL, DATESTAMP DESC'''
+    tables = partition_tables(connection, end_date=datestamp, newest_first=True)
+    try:
+        for table in tables:
+            short = [material for material in histories if len(histories[material]) < VALIDATION_HISTORY_LENGTH]
+            if not short:
+                break
+            cursor = connection.execute(sql.format(prices=table, materials=",".join("?" * len(short))),
+                                        [yard, datestamp] + short + [VALIDATION_HISTORY_LENGTH])
+            for material, price in cursor:
+                if len(histories[material]) < VALIDATION_HISTORY_LENGTH:
+                    histories[material].append(price)
+    finally:
+        tables.close()
+    for history in histories.values():
+        history.reverse()
+    return histories
+
+def find_missing_materials(connection, yard, materials):
+    """ Returns the materials of the yard's previous update missing from materials. """
+    cursor = connection.execute('''SELECT MATERIAL FROM LATEST_PRICES WHERE YARD=? AND DATESTAMP=
+                                   (SELECT MAX(DATESTAMP) FROM LATEST_PRICES WHERE YARD=?)''', (yard, yard))
+    return sorted(set(row[0] for row in cursor) - set(materials))
+
+def record_anomalies(connection, anomalies):
+    """ Stores (yard, material, datestamp, kind, detail) anomalies in PRICE_ANOMALIES. """
+    connection.executemany("INSERT INTO PRICE_ANOMALIES VALUES (?,?,?,?,?)", anomalies)
+
+def format_anomaly(anomaly):
+    """ Returns a one line description of an anomaly. """
+    yard, material, datestamp, kind, detail = anomaly
+    return "{} {} {} {}: {}".format(datestamp, yard, material or "", kind, detail)
+
+def show_message(window, message):
+    """ Shows message in a dialog, or prints it when running headless. """
+    if window is None:
+        print(message)
+    else:
+        dialog = Gtk.MessageDialog(
+            transient_for=window,
+            flags=0,
+            message_type=Gtk.MessageType.INFO,
+            buttons=Gtk.ButtonsType.OK,
+            text=message,
+        )
+        dialog.run()
+        dialog.destroy()
+
+def add_alert_rule(connection, yard, material, rule_type, value=None, long_window=None):
+    """ Adds a price alert rule and returns its id. """
+    if rule_type not in ALERT_RULE_TYPES:
+        raise ValueError("Unknown alert rule type: " + rule_type)
+    if rule_type in ("threshold", "percent_change", "ma_crossover") and value is None:
+        raise ValueError(rule_type + " rules need a value.")
+    if rule_type == "ma_crossover":
+        if long_window is None or not (0 < value < long_window < ALERT_HISTORY_LENGTH):
+            raise ValueError("Moving average windows must satisfy 0 < short < long < "
+                             + str(ALERT_HISTORY_LENGTH) + ".")
+    cursor = connection.execute('''INSERT INTO ALERT_RULES (YARD, MATERIAL, RULE_TYPE, VALUE, LONG_WINDOW)
+                                   VALUES (?,?,?,?,?)''',
+                                (yard, material, rule_type, value, long_window))
+    connection.commit()
+    return cursor.lastrowid
+
+def remove_alert_rule(connection, rule_id):
+    """ Removes the price alert rule with rule_id. """
+    connection.execute("DELETE FROM ALERT_RULES WHERE ID=?", (rule_id,))
+    connection.commit()
+
+def load_alert_state(connection, yard, material, datestamp):
+    """ Returns the rolling alert state of a yard and material.  Missing state is
+    seeded once from the price history before datestamp. """
+    row = connection.execute('''SELECT LAST_PRICE, LAST_DATESTAMP, HIGH_PRICE, LOW_PRICE, RECENT_PRICES
+                                FROM ALERT_STATE WHERE YARD=? AND MATERIAL=?''',
+                             (yard, material)).fetchone()
+    if row is not None:
+        recent = [float(price) for price in row[4].split(',') if price]
+        return {"last_price": row[0], "last_datestamp": row[1],
+                "high": row[2], "low": row[3], "recent": recent}
+
+    history = recent_partition_prices(connection, yard, material, datestamp, ALERT_HISTORY_LENGTH)
+    extremes = query_partitions(connection, '''SELECT MAX(PRICE), MIN(PRICE) FROM {prices}
+                                               WHERE YARD=? AND MATERIAL=? AND DATESTAMP<?''',
+                                (yard, material, datestamp), end_date=datestamp)
+    highs = [row[0] for row in extremes if row[0] is not None]
+    lows = [row[1] for row in extremes if row[1] is not None]
+    high = max(highs) if highs else None
+    low = min(lows) if lows else None
+    state = {"last_price": None, "last_datestamp": None,
+             "high": high, "low": low, "recent": [row[0] for row in history]}
+    if history:
+        state["last_price"], state["last_datestamp"] = history[-1]
+    return state
+
+def load_alert_states(connection, records):
+    """ Returns the alert state of the yard and material of each price record.
+    Seeding state may attach archives, so this must run before the records are
+    inserted, while no write transaction is open. """
+    states = {}
+    for yard, material, price, unit, datestamp in records:
+        if (yard, material) not in states:
+            states[(yard, material)] = load_alert_state(connection, yard, material, datestamp)
+    return states
+
+def save_alert_state(connection, yard, material, state, price, datestamp):
+    """ Adds price to the rolling alert state, in state and in the database. """
+    recent = (state["recent"] + [price])[-ALERT_HISTORY_LENGTH:]
+    high = price if state["high"] is None else max(state["high"], price)
+    low = price if state["low"] is None else min(state["low"], price)
+    connection.execute('''INSERT OR REPLACE INTO ALERT_STATE VALUES (?,?,?,?,?,?,?)''',
+                       (yard, material, price, datestamp, high, low,
+                        ','.join(repr(p) for p in recent)))
+    state.update({"last_price": price, "last_datestamp": datestamp,
+                  "high": high, "low": low, "recent": recent})
+
+def mean(values):
+    """ Returns the arithmetic mean of values. """
+    return sum(values) / len(values)
+
+def check_alert_rule(rule_type, value, long_window, state, price):
+    """ Returns a description of how price triggers the alert rule, or None. """
+    last_price = state["last_price"]
+    if rule_type == "threshold" and last_price is not None:
+        if last_price < value <= price:
+            return "rose above " + currencytostr(value).strip()
+        if last_price > value >= price:
+            return "fell below " + currencytostr(value).strip()
+    elif rule_type == "percent_change" and last_price:
+        change = (price - last_price) / last_price * 100
+        if abs(change) >= value:
+            return "changed {:+.1f}% from {}".format(change, currencytostr(last_price).strip())
+    elif rule_type == "ma_crossover":
+        short_window = int(value)
+        before = state["recent"]
+        after = before + [price]
+        if len(before) >= long_window:
+            diff_before = mean(before[-short_window:]) - mean(before[-long_window:])
+            diff_after = mean(after[-short_window:]) - mean(after[-long_window:])
+            if diff_before <= 0 < diff_after:
+                return "{}-point average crossed above {}-point average".format(short_window, long_window)
+            if diff_before >= 0 > diff_after:
+                return "{}-point average crossed below {}-point average".format(short_window, long_window)
+    elif rule_type == "new_high" and state["high"] is not None:
+        if price > state["high"]:
+            return "reached a new high (previous " + currencytostr(state["high"]).strip() + ")"
+    elif rule_type == "new_low" and state["low"] is not None:
+        if price < state["low"]:
+            return "reached a new low (previous " + currencytostr(state["low"]).strip() + ")"
+    return None
+
+def evaluate_alert_rules(connection, records, states):
+    """ Evaluates alert rules against newly inserted price records and updates
+    the rolling alert state in states, from load_alert_states.  Returns a list
+    of (alert id, message) pairs, where the alert id names the yard, material
+    and rule that raised the alert. """
+    rules = {}
+    cursor = connection.execute("SELECT ID, YARD, MATERIAL, RULE_TYPE, VALUE, LONG_WINDOW FROM ALERT_RULES")
+    for rule_id, yard, material, rule_type, value, long_window in cursor:
+        rules.setdefault((yard, material), []).append((rule_id, rule_type, value, long_window))
+
+    messages = []
+    for yard, material, price, unit, datestamp in records:
+        state = states[(yard, material)]
+        # skip records already seen, so reinserted dates do not raise alerts twice
+        if state["last_datestamp"] is not None and state["last_datestamp"] >= datestamp:
+            continue
+        for rule_id, rule_type, value, long_window in rules.get((yard, material), []):
+            description = check_alert_rule(rule_type, value, long_window, state, price)
+            if description is not None:
+                alert_id = "price-alert-" + yard + "-" + material + "-" + str(rule_id)
+                messages.append((alert_id, yard + " " + material + " " + description + ", now "
+                                 + currencytostr(price).strip() + "/" + unit.strip()
+                                 + " on " + datestamp + "."))
+        save_alert_state(connection, yard, material, state, price, datestamp)
+
+    return messages
+
+def send_alert_notifications(window, messages):
+    """ Shows (alert id, message) pairs as desktop notifications, or prints them
+    when running headless.  A new alert from the same rule replaces the last one
+    shown, and alerts from other rules are kept. """
+    if window is None:
+        for alert_id, message in messages:
+            print("ALERT: " + message)
+        return
+
+    application = window.get_application()
+    for alert_id, message in messages:
+        notification = Gio.Notification.new("Scrap Price Alert")
+        notification.set_body(message)
+        application.send_notification(alert_id, notification)
+
 def fetch_price_updates(self, selected_scrap_yard):
-    """ Retrieves price updates from selected_scrap_yard website. """
+    """ Retrieves price updates from selected_scrap_yard website.
+    self is the main window, or None when running headless. """
 
-    # read remote file from Zubicks web site
-    if selected_scrap_yard == "Zubicks":
-        source = urllib.request.urlopen('https://www.zubicks.com/prices/').read()
-        content = bs.BeautifulSoup(source, 'lxml')
+    # read remote file from the scrap yard web site
+    source = urllib.request.urlopen(YARD_URLS[selected_scrap_yard], timeout=URL_TIMEOUT).read()
+    content = bs.BeautifulSoup(source, 'lxml')
 
-    # get datestamp
+    # get datestamp, leaving it None when the header is missing or has changed layout
+    datestamp = None
     for header in content.find_all('h4'):
         header_str = header.text
         if header_str.startswith("Updated"):
-            junk, month, day, year = header_str.split()
-            datestamp = year + '-' + month_number(month) + '-' + day[0:2]
+            words = header_str.split()
+            if len(words) == 4 and words[1] in MONTH_NAMES[1:]:
+                junk, month, day, year = words
+                datestamp = year + '-' + month_number(month) + '-' + day[0:2]
 
     # check for existing database
-    if os.path.isfile(DB_FILE):
-        connection = sqlite3.connect(DB_FILE)
-        # get datestamp of last update in database table PRICES
-        for row in connection.execute("SELECT DISTINCT DATESTAMP FROM PRICES ORDER BY DATESTAMP DESC LIMIT 1"):
-            lastdate = row[0]
-        if lastdate == datestamp:
-            dialog = Gtk.MessageDialog(
-                transient_for=self,
-                flags=0,
-                message_type=Gtk.MessageType.INFO,
-                buttons=Gtk.ButtonsType.OK,
-                text="No prices updates available.",
-            )
-            dialog.run()
-            dialog.destroy()
-            connection.close
-            return
-    else:
+    if not os.path.isfile(DB_FILE):
         create_database()
 
+    # connect to database
+    connection = sqlite3.connect(DB_FILE)
+    prepare_database(connection)
+
+    # reject the whole update when the page has no usable datestamp
+    if datestamp is None:
+        datestamp_error = "no readable update date on the price list"
+    else:
+        datestamp_error = check_datestamp(datestamp)
+    if datestamp_error is None and int(datestamp[:4]) in archived_years():
+        datestamp_error = datestamp[:4] + " is sealed"
+    if datestamp_error is not None:
+        show_message(self, "Price update rejected: " + datestamp_error + ".")
+        connection.close()
+        return
+
+    # get datestamp of last update for this yard, which may be in a sealed year
+    lastdate = connection.execute("SELECT MAX(DATESTAMP) FROM LATEST_PRICES WHERE YARD=?",
+                                  (selected_scrap_yard,)).fetchone()[0]
+    if lastdate is not None and datestamp <= lastdate:
+        show_message(self, "No prices updates available.")
+        connection.close()
+        return
+
     # get price updates and insert into database
     # get price tables
     tables = content.find_all('table')
@@ -184,47 +715,90 @@ def fetch_price_updates(self, selected_scrap_yard):
             if columns:                             # if columns are not empty
                 material_prices.append(columns)     # add table data to material prices list
 
-    # connect to database
-    connection = sqlite3.connect(DB_FILE)
-
-    # get material prices and insert into database
+    # get material prices and check them against their recent history.  Reading the
+    # history may attach archives, which cannot be detached once an INSERT has opened
+    # a write transaction, so every read of the price history happens before the inserts.
+    new_records = []
+    new_record_units = []   # original price, original unit and price per kilogram of each record
+    anomalies = []
     for row in range(len(material_prices)):
-        material_str = material_prices[row][0].rstrip()             # get first string as material
-        priceperunit_str, junk = material_prices[row][1].split('|') # get 2nd string as price per unit and discard 3rd string
-        price_str, unit_str = priceperunit_str.split('/')           # get price and unit
-        price = float(price_str[1:])                                # convert price string to float
-        # convert from price per net tonne to price per pound
-        if "nt" in unit_str:
-            price = price / float(POUNDS_PER_NET_TONNE)
+        try:
+            material_str = material_prices[row][0].rstrip()             # get first string as material
+            priceperunit_str, junk = material_prices[row][1].split('|') # get 2nd string as price per unit and discard 3rd string
+            price_str, unit_str = priceperunit_str.split('/')           # get price and unit
+            price = float(price_str[1:])                                # convert price string to float
+        except (IndexError, ValueError):
+            # the price list layout has changed
+            anomalies.append((selected_scrap_yard, None, datestamp, "rejected",
+                              "unreadable row " + repr(material_prices[row])))
+            continue
+        # a price of zero means the material is not being bought
+        if price == 0:
+            continue
+        record_error = check_price_record(selected_scrap_yard, material_str, price, unit_str, datestamp)
+        if record_error is not None:
+            anomalies.append((selected_scrap_yard, material_str, datestamp, "rejected", record_error))
+            continue
+        original_price = price
+        original_unit = unit_str.strip()
+        price_per_kg = None
+        # convert prices per unit of mass to price per pound, and keep the price per kilogram
+        if zsa_units.is_mass_unit(unit_str):
+            price = zsa_units.convert_price(original_price, unit_str, 'lb')
+            price_per_kg = zsa_units.convert_price(original_price, unit_str, 'kg')
             unit_str = 'lb'
-        # print ("Zubicks", material_str, price, unit_str, datestamp)
-        # store scrap_yard, material, price, unit, datestamp in sql database.
-        if price > 0:
-            connection.execute('INSERT INTO PRICES VALUES (?,?,?,?,?)',
-                               ("Zubicks", material_str, price, unit_str,
-                                datestamp))
+        # print (selected_scrap_yard, material_str, price, unit_str, datestamp)
+        new_records.append((selected_scrap_yard, material_str, price, unit_str, datestamp))
+        new_record_units.append((original_price, original_unit, price_per_kg))
+
+    # flag suspicious changes, but keep the prices
+    histories = recent_price_histories(connection, selected_scrap_yard,
+                                       [record[1] for record in new_records], datestamp)
+    for record in new_records:
+        for kind, detail in check_price_change(histories[record[1]], record[2]):
+            anomalies.append((selected_scrap_yard, record[1], datestamp, kind, detail))
+
+    alert_states = load_alert_states(connection, new_records)
+
+    # store scrap_yard, material, price, unit, datestamp in sql database.
+    connection.executemany('''INSERT INTO PRICES (YARD, MATERIAL, PRICE, UNIT, DATESTAMP,
+                              ORIGINAL_PRICE, ORIGINAL_UNIT, PRICE_PER_KG) VALUES (?,?,?,?,?,?,?,?)''',
+                           [record + units for record, units in zip(new_records, new_record_units)])
+
+    # report materials of the previous update that are missing from this one
+    for material in find_missing_materials(connection, selected_scrap_yard, [record[1] for record in new_records]):
+        anomalies.append((selected_scrap_yard, material, datestamp, "missing", "not in this update"))
+    record_anomalies(connection, anomalies)
+
+    # add any new material names to the search index
+    update_material_index(connection, [record[1] for record in new_records])
+    update_latest_prices(connection, new_records)
+
+    # evaluate alert rules against the new records only
+    alert_messages = evaluate_alert_rules(connection, new_records, alert_states)
 
     connection.commit()
+    invalidate_caches()
 
-    # Read back new records added.
-    cursor = connection.execute("SELECT YARD, MATERIAL, PRICE, UNIT, DATESTAMP FROM PRICES WHERE DATESTAMP=?", (datestamp,))
+    if self is not None:
+        # Read back new records added.
+        cursor = connection.execute("SELECT YARD, MATERIAL, PRICE, UNIT, DATESTAMP FROM PRICES WHERE YARD=? AND DATESTAMP=?",
+                                    (selected_scrap_yard, datestamp))
 
-    for record in cursor:
-        # Add new record to price liststore.
-        self.pricestore.append(record)
+        for record in cursor:
+            # Add new record to price liststore.
+            self.pricestore.append(record)
 
     connection.close
 
     update_message = "Prices updated for "+selected_scrap_yard+" on "+datestamp+"."
-    dialog = Gtk.MessageDialog(
-        transient_for=self,
-        flags=0,
-        message_type=Gtk.MessageType.INFO,
-        buttons=Gtk.ButtonsType.OK,
-        text=update_message,
-    )
-    dialog.run()
-    dialog.destroy()
+    if anomalies:
+        update_message += "\n\n" + str(len(anomalies)) + " suspicious prices:\n"
+        update_message += "\n".join(format_anomaly(anomaly) for anomaly in anomalies[:10])
+        if len(anomalies) > 10:
+            update_message += "\nand " + str(len(anomalies) - 10) + " more."
+    show_message(self, update_message)
+    send_alert_notifications(self, alert_messages)
 
 def text_cell_data_func(tree_view_column, cell_renderer, model, row, column):
     """ Custom cell data function to display currency. """
@@ -337,9 +911,9 @@ def calculate_date_range(date_selection):
         # Set start_date to first date in database table PRICES
         if os.path.isfile(DB_FILE):
             connection = sqlite3.connect(DB_FILE)
-            # get datestamp of first entry in database table PRICES
-            for row in connection.execute("SELECT DISTINCT DATESTAMP FROM PRICES ORDER BY DATESTAMP ASC LIMIT 1"):
-                first_date = row[0]
+            # get datestamp of first entry in database table PRICES and its archives
+            first_date = min(row[0] for row in query_partitions(connection, "SELECT MIN(DATESTAMP) FROM {prices}")
+                             if row[0] is not None)
             connection.close
         start_date = first_date
 
@@ -347,23 +921,368 @@ def calculate_date_range(date_selection):
 
     return date_range
 
-def plotgraph(materialsearch_str, start_date, end_date):
+def archive_file(year):
+    """ Returns the path of the archive database file of year. """
+    return ARCHIVE_DIR + 'zubicksprices_' + str(year) + '.db'
+
+def archived_years():
+    """ Returns the sorted list of years sealed into archive database files. """
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    years = []
+    for filename in os.listdir(ARCHIVE_DIR):
+        match = ARCHIVE_FILE_PATTERN.match(filename)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+def partition_tables(connection, start_date="0000-00-00", end_date="9999-99-99", newest_first=False):
+    """ Yields the name of the price table of each partition overlapping start_date
+    to end_date, oldest first, or newest first.  Archived years are attached one at
+    a time, while their table name is in use, so the connection must not be in a
+    write transaction.  The main database holds the newest prices, because
+    seal_year only seals the oldest year left in it. """
+    years = [year for year in archived_years() if start_date[:4] <= str(year) <= end_date[:4]]
+    if newest_first:
+        yield "main.PRICES"
+        years.reverse()
+    for year in years:
+        connection.execute("ATTACH DATABASE ? AS ARCHIVE", (archive_file(year),))
+        try:
+            yield "ARCHIVE.PRICES"
+        finally:
+            connection.execute("DETACH DATABASE ARCHIVE")
+    if not newest_first:
+        yield "main.PRICES"
+
+def iterate_partitions(connection, sql, params=(), start_date="0000-00-00", end_date="9999-99-99",
+                       chunk_size=SCAN_CHUNK_SIZE, newest_first=False):
+    """ Runs sql against each price partition overlapping start_date to end_date,
+    oldest first, or newest first, and yields the rows chunk_size at a time.
+    sql names the price table {prices}. """
+    tables = partition_tables(connection, start_date, end_date, newest_first)
+    try:
+        for table in tables:
+            cursor = connection.execute(sql.format(prices=table), params)
+            try:
+                rows = cursor.fetchmany(chunk_size)
+                while rows:
+                    yield rows
+                    rows = cursor.fetchmany(chunk_size)
+            finally:
+                # an open statement would stop the archive being detached
+                cursor.close()
+    finally:
+        tables.close()
+
+def query_partitions(connection, sql, params=(), start_date="0000-00-00", end_date="9999-99-99"):
+    """ Runs sql against each price partition overlapping start_date to end_date,
+    oldest first, and returns all the rows.  See iterate_partitions. """
+    rows = []
+    for chunk in iterate_partitions(connection, sql, params, start_date, end_date):
+        rows.extend(chunk)
+    return rows
+
+def recent_partition_prices(connection, yard, material, datestamp, count):
+    """ Returns up to count (price, datestamp) rows of a yard's material before
+    datestamp, oldest first.  Archives are only read when the main database
+    holds fewer than count earlier prices. """
+    sql = '''SELECT PRICE, DATESTAMP FROM {prices} WHERE YARD=? AND MATERIAL=? AND DATESTAMP<?
+             ORDER BY DATESTAMP DESC LIMIT ?'''
+    rows = []
+    chunks = iterate_partitions(connection, sql, (yard, material, datestamp, count),
+                                end_date=datestamp, newest_first=True)
+    try:
+        for chunk in chunks:
+            rows.extend(chunk)
+            if len(rows) >= count:
+                break
+    finally:
+        chunks.close()
+    rows = rows[:count]
+    rows.reverse()
+    return rows
+
+def iterate_prices_by_yard(connection, table, chunk_size=SCAN_CHUNK_SIZE):
+    """ Yields the (YARD, MATERIAL, PRICE, UNIT, DATESTAMP) rows of a price table
+    in yard and date order, chunk_size rows at a time.  Each chunk is read by its
+    own statement, continuing after the last row read, so no lock is held between
+    chunks. """
+    columns = "SELECT YARD, MATERIAL, PRICE, UNIT, DATESTAMP, rowid FROM " + table
+    yard = connection.execute("SELECT MIN(YARD) FROM " + table).fetchone()[0]
+    while yard is not None:
+        # prices without a datestamp sort first
+        rows = connection.execute(columns + " WHERE YARD=? AND DATESTAMP IS NULL ORDER BY rowid",
+                                  (yard,)).fetchall()
+        if rows:
+            yield [row[:5] for row in rows]
+        rows = connection.execute(columns + ''' WHERE YARD=? AND DATESTAMP IS NOT NULL
+                                              ORDER BY DATESTAMP, rowid LIMIT ?''',
+                                  (yard, chunk_size)).fetchall()
+        while rows:
+            yield [row[:5] for row in rows]
+            rows = connection.execute(columns + ''' WHERE YARD=? AND (DATESTAMP, rowid) > (?,?)
+                                                  ORDER BY DATESTAMP, rowid LIMIT ?''',
+                                      (yard, rows[-1][4], rows[-1][5], chunk_size)).fetchall()
+        yard = connection.execute("SELECT MIN(YARD) FROM " + table + " WHERE YARD>?", (yard,)).fetchone()[0]
+
+def scan_database(report=print):
+    """ Checks every price in the database and its archives for malformed records,
+    suspicious changes and materials missing since the yard's previous update,
+    calling report with each anomaly.  Prices are read in chunks, each by its own
+    statement so price updates can commit during the scan, and only the recent
+    prices of each material are kept in memory.  Returns the number of
+    prices checked and the number of anomalies. """
+    connection = sqlite3.connect(DB_FILE)
+    prepare_database(connection)
+
+    histories = {}          # recent prices of each yard and material
+    last_dates = {}         # datestamp of each yard's update being read
+    previous_materials = {} # materials in each yard's previous update
+    current_materials = {}  # materials in each yard's update being read
+    checked = 0
+    found = 0
+
+    def report_anomaly(anomaly):
+        nonlocal found
+        found += 1
+        report(format_anomaly(anomaly))
+
+    def finish_update(yard, datestamp):
+        # compare the finished update of the yard with its previous update
+        if yard in previous_materials:
+            for material in sorted(previous_materials[yard] - current_materials[yard]):
+                report_anomaly((yard, material, datestamp, "missing", "not in this update"))
+        previous_materials[yard] = current_materials[yard]
+
+    for table in partition_tables(connection):
+        for chunk in iterate_prices_by_yard(connection, table):
+            for yard, material, price, unit, datestamp in chunk:
+                checked += 1
+                if last_dates.get(yard) != datestamp:
+                    if yard in last_dates:
+                        finish_update(yard, last_dates[yard])
+                    last_dates[yard] = datestamp
+                    current_materials[yard] = set()
+                current_materials[yard].add(material)
+
+                record_error = check_price_record(yard, material, price, unit, datestamp)
+                if record_error is not None:
+                    report_anomaly((yard, material, datestamp, "malformed", record_error))
+                    continue
+                history = histories.setdefault((yard, material),
+                                               collections.deque(maxlen=VALIDATION_HISTORY_LENGTH))
+                for kind, detail in check_price_change(list(history), price):
+                    report_anomaly((yard, material, datestamp, kind, detail))
+                history.append(price)
+
+    for yard, datestamp in last_dates.items():
+        finish_update(yard, datestamp)
+    connection.close()
+    return checked, found
+
+def seal_year(year):
+    """ Moves the prices of a finished year from the main database into its own
+    archive database file.  Years must be sealed oldest first, so the archives
+    and the main database hold prices in date order.  Returns the number of
+    prices moved. """
+    if year >= date.today().year:
+        raise ValueError(str(year) + " is not finished yet.")
+    if os.path.isfile(archive_file(year)):
+        raise ValueError(str(year) + " is already sealed.")
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+
+    connection = sqlite3.connect(DB_FILE)
+    prepare_database(connection)
+    start_date = str(year) + '-01-01'
+    end_date = str(year) + '-12-31'
+    first_date = connection.execute("SELECT MIN(DATESTAMP) FROM PRICES").fetchone()[0]
+    if first_date is not None and first_date < start_date:
+        connection.close()
+        raise ValueError("Seal " + first_date[:4] + " before " + str(year) + ".")
+    count = connection.execute("SELECT COUNT(*) FROM PRICES WHERE DATESTAMP BETWEEN ? AND ?",
+                               (start_date, end_date)).fetchone()[0]
+    if count == 0:
+        connection.close()
+        raise ValueError("There are no prices for " + str(year) + ".")
+
+    # build the archive under a temporary name, so a failure cannot leave
+    # a partial archive that looks sealed
+    temporary_file = archive_file(year) + '.tmp'
+    if os.path.isfile(temporary_file):
+        os.remove(temporary_file)
+    connection.execute("ATTACH DATABASE ? AS ARCHIVE", (temporary_file,))
+    try:
+        # create the archive table with the same columns as the main table
+        table_sql = connection.execute("SELECT sql FROM main.sqlite_master WHERE name='PRICES'").fetchone()[0]
+        connection.execute(table_sql.replace("PRICES", "ARCHIVE.PRICES", 1))
+        connection.execute("CREATE INDEX ARCHIVE.PRICES_YARD_MATERIAL_DATE ON PRICES (YARD, MATERIAL, DATESTAMP)")
+        connection.execute("CREATE INDEX ARCHIVE.PRICES_MATERIAL_DATE ON PRICES (MATERIAL, DATESTAMP)")
+        connection.execute("CREATE INDEX ARCHIVE.PRICES_YARD_DATE ON PRICES (YARD, DATESTAMP)")
+        # copy and delete in one transaction, so a failure leaves the prices in the main database
+        connection.execute('''INSERT INTO ARCHIVE.PRICES SELECT * FROM main.PRICES
+                              WHERE DATESTAMP BETWEEN ? AND ? ORDER BY DATESTAMP''', (start_date, end_date))
+        connection.execute("DELETE FROM main.PRICES WHERE DATESTAMP BETWEEN ? AND ?", (start_date, end_date))
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        connection.execute("DETACH DATABASE ARCHIVE")
+        connection.close()
+        os.remove(temporary_file)
+        raise
+    connection.execute("DETACH DATABASE ARCHIVE")
+    os.replace(temporary_file, archive_file(year))
+
+    # reclaim the space freed in the main database file
+    connection.execute("VACUUM")
+    connection.close()
+    invalidate_caches()
+    return count
+
+def query_latest_prices(connection, yard=None):
+    """ Returns the prices of the most recent update of each yard, or of one yard. """
+    cursor = connection.execute('''WITH LATEST AS (SELECT YARD, MAX(DATESTAMP) AS DATESTAMP
+                                                FROM LATEST_PRICES WHERE ? IS NULL OR YARD=? GROUP BY YARD)
+                                   SELECT L.YARD, L.MATERIAL, L.PRICE, L.UNIT, L.DATESTAMP
+                                   FROM LATEST JOIN LATEST_PRICES L
+                                   ON L.YARD=LATEST.YARD AND L.DATESTAMP=LATEST.DATESTAMP
+                                   ORDER BY L.YARD, L.MATERIAL''', (yard, yard))
+    return cursor.fetchall()
+
+def query_price_range(connection, material, start_date, end_date, yard=None):
+    """ Returns the prices of material between start_date and end_date, oldest first. """
+    return query_partitions(connection, '''SELECT YARD, MATERIAL, PRICE, UNIT, DATESTAMP FROM {prices}
+                                           WHERE MATERIAL=? AND DATESTAMP BETWEEN ? AND ?
+                                           AND (? IS NULL OR YARD=?)
+                                           ORDER BY DATESTAMP, YARD''',
+                            (material, start_date, end_date, yard, yard), start_date, end_date)
+
+def query_price_rollup(connection, material, period="month", yard=None):
+    """ Returns the minimum, maximum and average price of material
+    for each week, month or year. """
+    if period not in ROLLUP_PERIODS:
+        raise ValueError("Unknown rollup period: " + period)
+    # periods never span two years, so each partition can be rolled up separately
+    return query_partitions(connection, '''SELECT YARD, ''' + ROLLUP_PERIODS[period] + ''' AS PERIOD,
+                                           MIN(PRICE), MAX(PRICE), AVG(PRICE), COUNT(*) FROM {prices}
+                                           WHERE MATERIAL=? AND (? IS NULL OR YARD=?)
+                                           GROUP BY YARD, PERIOD ORDER BY PERIOD, YARD''',
+                            (material, yard, yard))
+
+def query_best_prices(connection, canonical=None):
+    """ Returns the prices in the most recent update of every yard for each common
+    material name, or for one, ranked from the highest price paid to the lowest.
+    Materials a yard no longer lists are left out, and prices in different units
+    are ranked separately. """
+    cursor = connection.execute('''WITH LATEST AS (SELECT YARD, MAX(DATESTAMP) AS DATESTAMP
+                                                FROM LATEST_PRICES GROUP BY YARD)
+                                   SELECT COALESCE(E.CANONICAL, L.MATERIAL) AS NAME,
+                                   RANK() OVER (PARTITION BY COALESCE(E.CANONICAL, L.MATERIAL), LOWER(TRIM(L.UNIT))
+                                                ORDER BY L.PRICE DESC) AS POSITION,
+                                   L.YARD, L.MATERIAL, L.PRICE, L.UNIT, L.DATESTAMP
+                                   FROM LATEST JOIN LATEST_PRICES L
+                                   ON L.YARD=LATEST.YARD AND L.DATESTAMP=LATEST.DATESTAMP
+                                   LEFT JOIN MATERIAL_EQUIVALENTS E
+                                   ON E.YARD=L.YARD AND E.MATERIAL=L.MATERIAL
+                                   WHERE ? IS NULL OR COALESCE(E.CANONICAL, L.MATERIAL)=?
+                                   ORDER BY NAME, LOWER(TRIM(L.UNIT)), POSITION, L.YARD''', (canonical, canonical))
+    return cursor.fetchall()
+
+def query_price_spread(connection, canonical, start_date, end_date, unit="lb"):
+    """ Returns the highest price, best yard, lowest price and spread between yards
+    of a common material name for each date between start_date and end_date,
+    using prices per unit only.  A yard's price stays in effect until its next
+    update, for at most SPREAD_MAX_AGE_DAYS, so only the partitions from
+    SPREAD_MAX_AGE_DAYS before start_date are read. """
+    # prices still in effect on start_date were set at most SPREAD_MAX_AGE_DAYS before it
+    try:
+        seed_date = (date.fromisoformat(start_date) - timedelta(days=SPREAD_MAX_AGE_DAYS)).isoformat()
+    except ValueError:
+        seed_date = start_date
+    cursor = query_partitions(connection, '''WITH MEMBERS AS (SELECT YARD, MATERIAL FROM main.MATERIAL_EQUIVALENTS
+                                                         WHERE CANONICAL=?
+                                                         UNION
+                                                         SELECT YARD, MATERIAL FROM main.LATEST_PRICES L
+                                                         WHERE MATERIAL=? AND NOT EXISTS
+                                                             (SELECT 1 FROM main.MATERIAL_EQUIVALENTS E
+                                                              WHERE E.YARD=L.YARD AND E.MATERIAL=L.MATERIAL))
+                                           SELECT P.DATESTAMP, P.YARD, P.PRICE FROM MEMBERS JOIN {prices} P
+                                           ON P.YARD=MEMBERS.YARD AND P.MATERIAL=MEMBERS.MATERIAL
+                                           AND P.DATESTAMP BETWEEN ? AND ? AND LOWER(TRIM(P.UNIT))=?
+                                           ORDER BY P.DATESTAMP''',
+                              (canonical, canonical, seed_date, end_date, unit.lower()), seed_date, end_date)
+
+    spread = []
+    current_prices = {}     # price and datestamp of each yard's latest update
+    last_date = None
+    for datestamp, yard, price in cursor:
+        if last_date is not None and datestamp != last_date and last_date >= start_date:
+            spread.append(spread_row(last_date, current_prices))
+        current_prices[yard] = (price, datestamp)
+        last_date = datestamp
+    if last_date is not None and last_date >= start_date:
+        spread.append(spread_row(last_date, current_prices))
+    return spread
+
+def spread_row(datestamp, current_prices):
+    """ Returns the date, best yard, highest price, lowest price and spread of the
+    (price, datestamp) current_prices of each yard, leaving out prices more than
+    SPREAD_MAX_AGE_DAYS old.  The yard updated on datestamp is always included. """
+    oldest = (date.fromisoformat(datestamp) - timedelta(days=SPREAD_MAX_AGE_DAYS)).isoformat()
+    prices = dict((yard, price) for yard, (price, updated) in current_prices.items() if updated >= oldest)
+    best_yard = max(prices, key=prices.get)
+    high = prices[best_yard]
+    low = min(prices.values())
+    return (datestamp, best_yard, high, low, high - low)
+
+def plot_price_spread(canonical, start_date, end_date):
+    """ Plots the highest and lowest prices paid by all yards for a common
+    material name using matplotlib. """
+    connection = sqlite3.connect(DB_FILE)
+    spread = query_price_spread(connection, canonical, start_date, end_date)
+    connection.close()
+    if not spread:
+        return
+
+    days = [matplotlib.dates.datestr2num(row[0]) for row in spread]
+    highs = [row[2] for row in spread]
+    lows = [row[3] for row in spread]
+
+    fig, ax = matplotlib.pyplot.subplots(figsize=(12, 9))
+    ax.step(days, highs, 'g-', linewidth=2, where='post', label='Best Price')
+    ax.step(days, lows, 'r-', linewidth=2, where='post', label='Lowest Price')
+    ax.fill_between(days, lows, highs, step='post', color='grey', alpha=0.3, label='Spread')
+    ax.set(xlabel='Date', ylabel='Price per Pound', title="Price Spread Between Yards for\n" + canonical)
+    ax.grid(True)
+    ax.legend()
+    ax.xaxis.set_major_locator(matplotlib.dates.MonthLocator())
+    ax.xaxis.set_major_formatter(matplotlib.dates.DateFormatter('%b\n%Y'))
+    ax.yaxis.set_major_formatter(matplotlib.ticker.StrMethodFormatter('${x:.2f}'))
+    matplotlib.pyplot.show()
+
+def plotgraph(materialsearch_str, start_date, end_date, display_unit="lb"):
     """ Plots graph of dates vs prices for specified material
-    and date range using matplotlib. """
+    and date range using matplotlib, with prices per display_unit. """
+    selected_yard = "Zubicks"
 	# check for existing database file
     if os.path.isfile(DB_FILE):
         connection = sqlite3.connect(DB_FILE)
 
-        # select all dates
-        # cursor = connection.execute("SELECT * from PRICES WHERE MATERIAL=?", (materialsearch_str,))
         # select dates between start_date and end_date
-        cursor = connection.execute("SELECT * from PRICES WHERE MATERIAL=? AND DATESTAMP BETWEEN ? and ?", (materialsearch_str, start_date, end_date,))
+        cursor = query_price_range(connection, materialsearch_str, start_date, end_date)
 
         prices = []
+        units = []
         dates = []
         for row in cursor:
             dates.append(row[4])	# store date in list
             prices.append(row[2])	# store price in list
+            units.append(row[3])	# store unit in list
+
+        # select earlier prices too, so indicators are defined from start_date
+        history_start = datetime.strptime(start_date, "%Y-%m-%d") - timedelta(days=zsa_analytics.LOOKBACK_DAYS)
+        history = query_price_range(connection, materialsearch_str, history_start.strftime("%Y-%m-%d"),
+                                    end_date, selected_yard)
 
         connection.close
     else:
@@ -382,10 +1301,9 @@ def plotgraph(materialsearch_str, start_date, end_date):
     fig, ax = matplotlib.pyplot.subplots(figsize=(12, 9))
     #matplotlib.pyplot.plot_date will be deprecated in the future.  Do not use.
     #ax.plot_date(days, prices, 'bo-', markersize=4, linewidth=2)
-    ax.step(days, prices, 'bo-', markersize=4, linewidth=2, where='post')
-    selected_yard = "Zubicks"
+    price_line, = ax.step(days, prices, 'bo-', markersize=4, linewidth=2, where='post')
     title_str = selected_yard + " Purchase Price for\n" + materialsearch_str
-    ax.set(xlabel='Date', ylabel='Price per Pound', title=title_str)
+    ax.set(xlabel='Date', title=title_str)
     ax.grid(True)
 
     # format the date ticks
@@ -411,31 +1329,129 @@ def plotgraph(materialsearch_str, start_date, end_date):
     tick = matplotlib.ticker.StrMethodFormatter(fmt)
     ax.yaxis.set_major_formatter(tick)
 
-    max_yvalue = max(prices)
-    min_yvalue = min(prices)
-
-    if min_yvalue < 0.5:
-        ypadding = 0.01
-    else:
-        ypadding = 0.1
+    def set_price_axis(shown_prices, shown_units):
+        """ Sets the price axis limits and label for the prices shown. """
+        max_yvalue = max(shown_prices)
+        min_yvalue = min(shown_prices)
 
-    matplotlib.pyplot.ylim(min_yvalue-ypadding, max_yvalue+ypadding)
+        if min_yvalue < 0.5:
+            ypadding = 0.01
+        else:
+            ypadding = 0.1
+
+        ax.set_ylim(min_yvalue-ypadding, max_yvalue+ypadding)
+        ax.set_ylabel(zsa_units.price_label(shown_units))
+
+    set_price_axis(prices, units)
+
+    unit_state = {"unit": "lb"}
+    rescale_overlays = add_indicator_overlays(fig, ax, materialsearch_str, start_date, end_date,
+                                              history, unit_state)
+
+    def set_display_unit(unit_name):
+        """ Converts the plotted prices to the unit named unit_name. """
+        unit = [key for key in zsa_units.MASS_UNITS if zsa_units.UNIT_NAMES[key] == unit_name][0]
+        # convert the whole price column in one step, without querying the database again
+        converted_prices, converted_units = zsa_units.convert_prices(prices, units, unit)
+        price_line.set_ydata(converted_prices)
+        if rescale_overlays is not None:
+            rescale_overlays(zsa_units.price_factor(unit_state["unit"], unit))
+        unit_state["unit"] = unit
+        # prices per each are not converted, so scale and label the axis by what is shown
+        set_price_axis(converted_prices, converted_units)
+        fig.canvas.draw_idle()
+
+    unit_axes = fig.add_axes([0.01, 0.15, 0.19, 0.2])
+    unit_names = [zsa_units.UNIT_NAMES[unit] for unit in zsa_units.MASS_UNITS]
+    unit_buttons = matplotlib.widgets.RadioButtons(unit_axes, unit_names,
+                                                   active=zsa_units.MASS_UNITS.index(display_unit))
+    unit_buttons.on_clicked(set_display_unit)
+    # keep a reference to the buttons, or they stop responding
+    fig.unit_buttons = unit_buttons
+    if display_unit != "lb":
+        set_display_unit(zsa_units.UNIT_NAMES[display_unit])
 
     matplotlib.pyplot.show()
 
+def add_indicator_overlays(fig, ax, material, start_date, end_date, history, unit_state):
+    """ Adds check buttons to a price graph that toggle technical indicator overlays.
+    Indicators are computed from the history price rows when first shown, and
+    drawn per unit_state["unit"].  Returns a function that multiplies the plotted
+    price indicators by a factor when the unit changes. """
+    if not history:
+        return None
+    history_days = [matplotlib.dates.datestr2num(row[4]) for row in history]
+    history_prices = [row[2] for row in history]
+    start_day = matplotlib.dates.datestr2num(start_date)
+    end_day = matplotlib.dates.datestr2num(end_date)
+
+    overlays = {}
+    percent_axes = []
+
+    def toggle_overlay(label):
+        if label in overlays:
+            for artist in overlays[label]:
+                artist.set_visible(not artist.get_visible())
+        else:
+            days, values = zsa_analytics.cached_indicator(material, start_day, end_day, label,
+                                                          history_days, history_prices)
+            kind = zsa_analytics.indicator_kind(label)
+            factor = zsa_units.price_factor("lb", unit_state["unit"])
+            # give each indicator its own colour, skipping the blue of the price line
+            color = 'C' + str(labels.index(label) + 1)
+            if kind == "band":
+                overlays[label] = [ax.fill_between(days, values[0] * factor, values[1] * factor,
+                                                   color=color, alpha=0.2, label=label)]
+            elif kind == "average":
+                overlays[label] = ax.plot(days, values * factor, color=color, linewidth=1.5, label=label)
+            else:
+                # percentages are drawn against a second axis on the right
+                if not percent_axes:
+                    percent_axis = ax.twinx()
+                    percent_axis.set_ylabel('Percent')
+                    percent_axis.yaxis.set_major_formatter(matplotlib.ticker.StrMethodFormatter('{x:.0f}%'))
+                    percent_axes.append(percent_axis)
+                overlays[label] = percent_axes[0].plot(days, values, '--', color=color, linewidth=1, label=label)
+
+        visible = [artists[0] for artists in overlays.values() if artists[0].get_visible()]
+        if visible:
+            ax.legend(handles=visible, loc='upper left')
+        elif ax.get_legend() is not None:
+            ax.get_legend().remove()
+        fig.canvas.draw_idle()
+
+    fig.subplots_adjust(left=0.27)
+    button_axes = fig.add_axes([0.01, 0.4, 0.19, 0.2])
+    labels = [name for name, kind, window in zsa_analytics.INDICATORS]
+    buttons = matplotlib.widgets.CheckButtons(button_axes, labels, [False] * len(labels))
+    buttons.on_clicked(toggle_overlay)
+    # keep a reference to the buttons, or they stop responding
+    fig.indicator_buttons = buttons
+
+    def rescale_overlays(factor):
+        for label, artists in overlays.items():
+            kind = zsa_analytics.indicator_kind(label)
+            if kind == "average":
+                artists[0].set_ydata(artists[0].get_ydata() * factor)
+            elif kind == "band":
+                for path in artists[0].get_paths():
+                    path.vertices[:, 1] *= factor
+
+    return rescale_overlays
+
 def populate_yard_combo():
     """ Populates yard selection combobox by reading data from sql database. """
     if os.path.isfile(DB_FILE):
         # Open database file
         connection = sqlite3.connect(DB_FILE)
 
-        # Get list of distinct scrap yards and put in yard_store
-        cursor = connection.execute("SELECT DISTINCT YARD FROM PRICES ORDER BY YARD")
+        # Get list of distinct scrap yards in every partition and put in yard_store
+        cursor = query_partitions(connection, "SELECT DISTINCT YARD FROM {prices}")
 
         yard_store = Gtk.ListStore(str)
 
         yard_store.append(["All Yards"])
-        for record in cursor:
+        for record in sorted(set(cursor)):
             yard_store.append(record)
 
         connection.close()
@@ -450,13 +1466,13 @@ def populate_material_combo():
         # Open database file
         connection = sqlite3.connect(DB_FILE)
 
-        # Get list of distinct materials and put in material_store
-        cursor = connection.execute("SELECT DISTINCT MATERIAL FROM PRICES ORDER BY MATERIAL")
+        # Get list of distinct materials in every partition and put in material_store
+        cursor = query_partitions(connection, "SELECT DISTINCT MATERIAL FROM {prices}")
 
         material_store = Gtk.ListStore(str)
 
         material_store.append(["All Materials"])
-        for record in cursor:
+        for record in sorted(set(cursor)):
             material_store.append(record)
 
         connection.close()
@@ -465,6 +1481,328 @@ def populate_material_combo():
 
     return material_store
 
+class ResponseCache:
+    """ A thread safe least recently used cache of JSON query responses.
+    The generation counts clears, so a response computed from data read
+    before a clear is not stored after it. """
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+QUERY_CACHE = ResponseCache(QUERY_CACHE_SIZE)
+
+def invalidate_caches():
+    """ Clears cached query results and indicators after new prices are committed. """
+    QUERY_CACHE.clear()
+    zsa_analytics.clear_cache()
+
+class ConnectionPool:
+    """ A fixed size pool of read only database connections shared by server threads. """
+    def __init__(self, db_file, size):
+        uri = 'file:' + urllib.request.pathname2url(os.path.abspath(db_file)) + '?mode=ro'
+        self.connections = queue.Queue()
+        for index in range(size):
+            connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            # remember data_version so commits by other connections or processes can be detected
+            data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+            self.connections.put([connection, data_version])
+
+    def acquire(self):
+        """ Returns a pooled connection, and whether the database changed since it was last used. """
+        entry = self.connections.get()
+        data_version = entry[0].execute("PRAGMA data_version").fetchone()[0]
+        changed = data_version != entry[1]
+        entry[1] = data_version
+        return entry, changed
+
+    def release(self, entry):
+        self.connections.put(entry)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get()[0].close()
+
+def price_rows_to_json(rows):
+    """ Converts PRICES rows to a list of dictionaries. """
+    return [{"yard": yard, "material": material, "price": price,
+             "unit": unit.strip(), "datestamp": datestamp}
+            for yard, material, price, unit, datestamp in rows]
+
+def convert_price_rows(rows, unit):
+    """ Converts the prices of PRICES rows to prices per unit in one step. """
+    if not rows:
+        return rows
+    prices, units = zsa_units.convert_prices([row[2] for row in rows], [row[3] for row in rows], unit)
+    return [(row[0], row[1], float(price), str(new_unit), row[4])
+            for row, price, new_unit in zip(rows, prices, units)]
+
+def run_json_query(connection, path, params):
+    """ Runs the query named by path with the query string params.
+    Returns an HTTP status and a JSON serializable result. """
+    yard = params.get("yard")
+    unit = params.get("unit", "lb")
+    if zsa_units.unit_key(unit) not in zsa_units.MASS_UNITS:
+        return 400, {"error": "unit must be one of " + ", ".join(zsa_units.MASS_UNITS)}
+    if path == "/prices/latest":
+        return 200, price_rows_to_json(convert_price_rows(query_latest_prices(connection, yard), unit))
+    if path == "/prices/range":
+        if "material" not in params:
+            return 400, {"error": "material is required"}
+        start_date = params.get("start", "0000-00-00")
+        end_date = params.get("end", "9999-99-99")
+        rows = query_price_range(connection, params["material"], start_date, end_date, yard)
+        return 200, price_rows_to_json(convert_price_rows(rows, unit))
+    if path == "/prices/rollup":
+        if "material" not in params:
+            return 400, {"error": "material is required"}
+        period = params.get("period", "month")
+        if period not in ROLLUP_PERIODS:
+            return 400, {"error": "period must be one of " + ", ".join(ROLLUP_PERIODS)}
+        rows = query_price_rollup(connection, params["material"], period, yard)
+        return 200, [{"yard": row[0], "period": row[1], "min": row[2], "max": row[3],
+                      "average": row[4], "count": row[5]} for row in rows]
+    if path == "/compare/best":
+        rows = query_best_prices(connection, params.get("material"))
+        return 200, [{"material": row[0], "rank": row[1], "yard": row[2], "yard_material": row[3],
+                      "price": row[4], "unit": row[5].strip(), "datestamp": row[6]} for row in rows]
+    if path == "/compare/spread":
+        if "material" not in params:
+            return 400, {"error": "material is required"}
+        start_date = params.get("start", "0000-00-00")
+        end_date = params.get("end", "9999-99-99")
+        rows = query_price_spread(connection, params["material"], start_date, end_date)
+        return 200, [{"datestamp": row[0], "best_yard": row[1], "high": row[2], "low": row[3],
+                      "spread": row[4]} for row in rows]
+    return 404, {"error": "unknown query " + path}
+
+def etag_matches(etag, if_none_match):
+    """ Tests if an If-None-Match header value lists etag, using the weak
+    comparison HTTP requires for If-None-Match. """
+    opaque_tag = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == opaque_tag:
+            return True
+    return False
+
+class QueryService:
+    """ Answers JSON price queries from a read only connection pool and a response cache. """
+    def __init__(self, db_file, pool_size=QUERY_POOL_SIZE, cache=QUERY_CACHE):
+        self.pool = ConnectionPool(db_file, pool_size)
+        self.cache = cache
+
+    def handle(self, request_path, headers):
+        """ Returns the status, headers and body of the response to a GET request. """
+        url = urllib.parse.urlsplit(request_path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        key = (url.path, tuple(sorted(params.items())))
+
+        entry, changed = self.pool.acquire()
+        try:
+            if changed:
+                self.cache.clear()
+            # taken before the query, so a clear during the query drops its response
+            generation = self.cache.generation
+            response = self.cache.get(key)
+            if response is None:
+                status, result = run_json_query(entry[0], url.path, params)
+                body = json.dumps(result).encode('utf-8')
+                # weak, since the plain and gzip encodings of the body share it
+                etag = 'W/"' + hashlib.sha1(body).hexdigest() + '"'
+                response = (status, etag, body, gzip.compress(body))
+                if status == 200:
+                    self.cache.put(key, response, generation)
+        finally:
+            self.pool.release(entry)
+
+        status, etag, body, gzipped_body = response
+        response_headers = {"Content-Type": "application/json",
+                            "ETag": etag,
+                            "Cache-Control": "no-cache",
+                            "Vary": "Accept-Encoding"}
+        if status == 200 and etag_matches(etag, headers.get("If-None-Match", "")):
+            return 304, response_headers, b""
+        if "gzip" in headers.get("Accept-Encoding", ""):
+            response_headers["Content-Encoding"] = "gzip"
+            body = gzipped_body
+        return status, response_headers, body
+
+class QueryRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Passes GET requests to the server's query service. """
+    def do_GET(self):
+        status, headers, body = self.server.query_service.handle(self.path, self.headers)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def create_query_server(port=QUERY_SERVER_PORT):
+    """ Creates a JSON query server listening on localhost only. """
+    if not os.path.isfile(DB_FILE):
+        print("Database does not exist.")
+        raise SystemExit
+    # create any missing indexes before the read only connections are opened
+    connection = sqlite3.connect(DB_FILE)
+    prepare_database(connection)
+    connection.close()
+
+    server = http.server.ThreadingHTTPServer((QUERY_SERVER_HOST, port), QueryRequestHandler)
+    server.daemon_threads = True
+    server.query_service = QueryService(DB_FILE)
+    return server
+
+class ComparisonWindow(Gtk.Window):
+    """ A window ranking the latest prices paid by each yard for every material. """
+    def __init__(self, parent):
+        Gtk.Window.__init__(self, title="Compare Yards", transient_for=parent)
+        self.set_border_width(10)
+        self.set_default_size(700, 500)
+        self.parent_window = parent
+
+        # place the window next to the main window
+        x, y = parent.get_position()
+        width, height = parent.get_size()
+        self.move(x + width + 10, y)
+
+        connection = sqlite3.connect(DB_FILE)
+        prepare_database(connection)
+        self.best_store = Gtk.ListStore(str, int, str, str, float, str, str)
+        for name, position, yard, material, price, unit, datestamp in query_best_prices(connection):
+            self.best_store.append([name, position, yard, material, price, unit, datestamp])
+        connection.close()
+
+        treeview = Gtk.TreeView.new_with_model(self.best_store)
+        renderer = TextCellRenderer()
+        column = TextTreeViewColumn("MATERIAL", renderer, text=0)
+        column.set_sort_column_id(0)
+        treeview.append_column(column)
+        column = Gtk.TreeViewColumn("RANK", TextCellRenderer(), text=1)
+        treeview.append_column(column)
+        column = TextTreeViewColumn("YARD", renderer, text=2)
+        column.set_sort_column_id(2)
+        treeview.append_column(column)
+        column = TextTreeViewColumn("YARD MATERIAL", renderer, text=3)
+        treeview.append_column(column)
+        column = CurrencyTreeViewColumn("PRICE", CurrencyCellRenderer(), text=4)
+        treeview.append_column(column)
+        column = TextTreeViewColumn("UNIT", renderer, text=5)
+        treeview.append_column(column)
+        column = DateTreeViewColumn("DATESTAMP", DateCellRenderer(), text=6)
+        column.set_sort_column_id(6)
+        treeview.append_column(column)
+        self.selection = treeview.get_selection()
+
+        scrolled_window = Gtk.ScrolledWindow()
+        scrolled_window.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(treeview)
+
+        spread_button = Gtk.Button.new_with_label("Plot Price Spread")
+        spread_button.connect("clicked", self.on_plot_spread_clicked)
+
+        vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
+        vbox.pack_start(scrolled_window, True, True, 0)
+        vbox.pack_start(spread_button, False, False, 0)
+        self.add(vbox)
+        self.show_all()
+
+    def on_plot_spread_clicked(self, button):
+        """ Plots the price spread of the selected material for the date range
+        selected in the main window. """
+        model, tree_iter = self.selection.get_selected()
+        if tree_iter is None:
+            show_message(self, "Please select a material.")
+            return
+        start_date, end_date = calculate_date_range(self.parent_window.date_range_combo.get_active_text())
+        plot_price_spread(model[tree_iter][0], start_date, end_date)
+
+class UnitConverterWindow(Gtk.Window):
+    """ A calculator converting prices and masses between units. """
+    def __init__(self, parent):
+        Gtk.Window.__init__(self, title="Unit Converter", transient_for=parent)
+        self.set_border_width(10)
+
+        self.kind_combo = Gtk.ComboBoxText()
+        self.kind_combo.append("price", "Price")
+        self.kind_combo.append("mass", "Mass")
+        self.kind_combo.set_active_id("price")
+        self.kind_combo.connect("changed", self.on_changed)
+
+        self.amount_entry = Gtk.Entry()
+        self.amount_entry.set_text("1")
+        self.amount_entry.connect("changed", self.on_changed)
+
+        self.from_combo = Gtk.ComboBoxText()
+        self.to_combo = Gtk.ComboBoxText()
+        for unit in zsa_units.MASS_UNITS:
+            self.from_combo.append(unit, zsa_units.UNIT_NAMES[unit])
+            self.to_combo.append(unit, zsa_units.UNIT_NAMES[unit])
+        self.from_combo.set_active_id("nt")
+        self.to_combo.set_active_id("lb")
+        self.from_combo.connect("changed", self.on_changed)
+        self.to_combo.connect("changed", self.on_changed)
+
+        self.result_label = Gtk.Label()
+        self.result_label.set_xalign(0.0)
+
+        grid = Gtk.Grid(column_spacing=10, row_spacing=10)
+        grid.attach(Gtk.Label(label="Convert"), 0, 0, 1, 1)
+        grid.attach(self.kind_combo, 1, 0, 1, 1)
+        grid.attach(Gtk.Label(label="Amount"), 0, 1, 1, 1)
+        grid.attach(self.amount_entry, 1, 1, 1, 1)
+        grid.attach(Gtk.Label(label="From"), 0, 2, 1, 1)
+        grid.attach(self.from_combo, 1, 2, 1, 1)
+        grid.attach(Gtk.Label(label="To"), 0, 3, 1, 1)
+        grid.attach(self.to_combo, 1, 3, 1, 1)
+        grid.attach(self.result_label, 0, 4, 2, 1)
+        self.add(grid)
+
+        self.on_changed(None)
+        self.show_all()
+
+    def on_changed(self, widget):
+        """ Shows the converted amount whenever an input changes. """
+        try:
+            amount = float(self.amount_entry.get_text())
+        except ValueError:
+            self.result_label.set_text("Please enter a number.")
+            return
+        from_unit = self.from_combo.get_active_id()
+        to_unit = self.to_combo.get_active_id()
+        if self.kind_combo.get_active_id() == "price":
+            price = zsa_units.convert_price(amount, from_unit, to_unit)
+            self.result_label.set_text("${:,.4f} per {}".format(price, zsa_units.UNIT_NAMES[to_unit]))
+        else:
+            mass = zsa_units.convert_mass(amount, from_unit, to_unit)
+            self.result_label.set_text("{:,.4f} {}".format(mass, zsa_units.UNIT_NAMES[to_unit]))
+
 class ZeffsScrapWindow(Gtk.ApplicationWindow):
     """ The main application window. """
     def populate_treeview(self):
@@ -480,14 +1818,14 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
             # Get list of column properties
             cursor = connection.execute('''PRAGMA table_info(PRICES)''')
 
-            # Get names of columns
-            column_names = [i[1] for i in cursor.fetchall()]
+            # Get names of columns shown in the treeview
+            column_names = [i[1] for i in cursor.fetchall()][:5]
 
             # Get list of column properties
             cursor = connection.execute('''PRAGMA table_info(PRICES)''')
 
-            # Get datatypes of columns
-            column_types = [i[2] for i in cursor.fetchall()]
+            # Get datatypes of columns shown in the treeview
+            column_types = [i[2] for i in cursor.fetchall()][:5]
 
             # Set types in ListStore for TreeView
             for index, item in enumerate(column_types):
@@ -500,10 +1838,8 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
                 elif item == 'INTEGER':
                     column_types[index] = int
 
-            # Get data from database file
-            cursor = connection.execute("SELECT YARD, MATERIAL, PRICE, UNIT, DATESTAMP from PRICES")
-
-            pricelist = cursor.fetchall()
+            # Get data from database file and its archives
+            pricelist = query_partitions(connection, "SELECT YARD, MATERIAL, PRICE, UNIT, DATESTAMP from {prices}")
 
             # Gtk.ListStore will hold data for the TreeView
             # Put data from file into a ListStore
@@ -519,6 +1855,7 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
         # Initialize filters
         self.current_yard_filter = None
         self.current_material_filter = None
+        self.current_search_filter = None
         self.current_daterange_filter = None
 
         # Create the yard filter, feeding it with the pricestore model
@@ -551,14 +1888,16 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
         column1.set_sort_column_id(1)
         self.sortedtreeview.append_column(column1)
 
-        # Column for PRICE field
+        # Column for PRICE field, shown per display unit
         renderer = CurrencyCellRenderer()
         column2 = CurrencyTreeViewColumn(column_names[2], renderer, text=2)
+        column2.set_cell_data_func(renderer, self.price_cell_data_func, 2)
         self.sortedtreeview.append_column(column2)
 
-        # Column for UNIT field
+        # Column for UNIT field, shown as the display unit
         renderer = TextCellRenderer()
         column3 = TextTreeViewColumn(column_names[3], renderer, text=3)
+        column3.set_cell_data_func(renderer, self.unit_cell_data_func, 3)
         self.sortedtreeview.append_column(column3)
 
         # Column for DATESTAMP field, allow sorting
@@ -570,6 +1909,24 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
         column4.set_sort_column_id(4)
         self.sortedtreeview.append_column(column4)
 
+    def price_cell_data_func(self, tree_view_column, cell_renderer, model, row, column):
+        """ Displays prices per pound as prices per the display unit. """
+        price, unit = model.get(row, column, 3)
+        price = zsa_units.convert_price(price, unit, self.display_unit)
+        return cell_renderer.set_property("text", currencytostr(price))
+
+    def unit_cell_data_func(self, tree_view_column, cell_renderer, model, row, column):
+        """ Displays units of mass as the display unit. """
+        unit = model.get(row, column)[0]
+        if zsa_units.is_mass_unit(unit):
+            unit = self.display_unit
+        return cell_renderer.set_property("text", unit)
+
+    def on_display_unit_changed(self, combo):
+        """ Redraws the price list with prices per the selected display unit. """
+        self.display_unit = combo.get_active_id()
+        self.sortedtreeview.queue_draw()
+
     def yard_filter_func(self, model, row, data):
         """ Tests if the yard in the row is the one in the filter """
         if self.current_yard_filter is None:
@@ -590,7 +1947,11 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
             self.yard_filter.refilter()
 
     def material_filter_func(self, model, row, data):
-        """ Tests if the material in the row is the one in the filter """
+        """ Tests if the material in the row is the one in the filter
+        and is one of the material search results. """
+        if self.current_search_filter is not None:
+            if model[row][1] not in self.current_search_filter:
+                return False
         if self.current_material_filter is None:
             return True
         else:
@@ -608,6 +1969,29 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
                 self.current_material_filter = selected_material
             self.material_filter.refilter()
 
+    def on_search_changed(self, search_entry):
+        """ Filters the treeview by every material matching the search entry,
+        and offers the best matches as completions. """
+        search_str = search_entry.get_text()
+        self.search_store.clear()
+        if search_str.strip() == "":
+            self.current_search_filter = None
+        else:
+            materials = search_materials(self.search_connection, search_str, limit=None)
+            for material in materials[:SEARCH_RESULT_LIMIT]:
+                self.search_store.append([material])
+            self.current_search_filter = set(materials)
+        self.material_filter.refilter()
+
+    def on_search_match_selected(self, completion, model, tree_iter):
+        """ Selects the chosen search result in the material selection combobox. """
+        selected_material = model[tree_iter][0]
+        for row in self.material_combo.get_model():
+            if row[0] == selected_material:
+                self.material_combo.set_active_iter(row.iter)
+                break
+        return False
+
     def daterange_filter_func(self, model, iter, data):
         """ Tests if the date in the row is inside the date range filter. """
         if self.current_daterange_filter is None:
@@ -688,7 +2072,11 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
             start_date = date_range[0]
             end_date = date_range[1]
 
-            plotgraph(selected_material, start_date, end_date)
+            plotgraph(selected_material, start_date, end_date, self.display_unit)
+
+    def on_compare_yards_clicked(self, button):
+        """ Opens the cross yard price comparison window. """
+        ComparisonWindow(self)
 
     def __init__(self, app):
         Gtk.Window.__init__(self, title="Zubick's Scrap App", application=app)
@@ -701,6 +2089,17 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
         # Add about_action to window
         self.add_action(about_action)
 
+        # Create query_server_action to start the JSON query server
+        query_server_action = Gio.SimpleAction.new("query_server", None)
+        query_server_action.connect("activate", self.query_server_callback)
+        self.add_action(query_server_action)
+        self.query_server = None
+
+        # Create unit_converter_action to open the unit converter window
+        unit_converter_action = Gio.SimpleAction.new("unit_converter", None)
+        unit_converter_action.connect("activate", self.unit_converter_callback)
+        self.add_action(unit_converter_action)
+
         yard_label = Gtk.Label(label="Choose Scrap Yard")
         yard_label.set_justify(Gtk.Justification.LEFT)
         material_label = Gtk.Label(label="Choose Material")
@@ -767,11 +2166,43 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
         plot_button.connect("clicked", self.on_plot_graph_clicked)
         hbox_bottom.pack_start(plot_button, False, False, 0)
 
+        compare_button = Gtk.Button.new_with_label("Compare Yards")
+        compare_button.connect("clicked", self.on_compare_yards_clicked)
+        hbox_bottom.pack_start(compare_button, False, False, 0)
+
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10)
         vbox.pack_start(hbox_top, False, False, 0)
         vbox.pack_start(hbox_middle, False, False, 0)
         vbox.pack_start(hbox_bottom, False, False, 0)
 
+        # Material search entry, backed by the material search index
+        self.search_connection = sqlite3.connect(DB_FILE)
+        prepare_database(self.search_connection)
+        self.search_store = Gtk.ListStore(str)
+        search_completion = Gtk.EntryCompletion()
+        search_completion.set_model(self.search_store)
+        search_completion.set_text_column(0)
+        # results are already matched and ranked by search_materials
+        search_completion.set_match_func(lambda completion, key, tree_iter, data: True, None)
+        search_completion.connect("match-selected", self.on_search_match_selected)
+        search_entry = Gtk.SearchEntry()
+        search_entry.set_placeholder_text("Search Materials")
+        search_entry.set_completion(search_completion)
+        search_entry.connect("search-changed", self.on_search_changed)
+
+        # Display unit selection, converts the price column without reading the database
+        self.display_unit = "lb"
+        display_unit_combo = Gtk.ComboBoxText()
+        for unit in zsa_units.MASS_UNITS:
+            display_unit_combo.append(unit, "Price per " + zsa_units.UNIT_NAMES[unit])
+        display_unit_combo.set_active_id(self.display_unit)
+        display_unit_combo.connect("changed", self.on_display_unit_changed)
+
+        hbox_search = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
+        hbox_search.pack_start(search_entry, True, True, 0)
+        hbox_search.pack_start(display_unit_combo, False, False, 0)
+        vbox.pack_start(hbox_search, False, False, 0)
+
         # Use ScrolledWindow to make the TreeView scrollable
         # Only allow vertical scrollbar
         scrolled_window = Gtk.ScrolledWindow()
@@ -785,6 +2216,23 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
         self.add(vbox)
         self.show_all()
 
+    def query_server_callback(self, action, parameter):
+        """ Starts the JSON query server in a background thread. """
+        if self.query_server is None:
+            try:
+                self.query_server = create_query_server()
+            except OSError as error:
+                show_message(self, "Could not start query server: " + str(error))
+                return
+            server_thread = threading.Thread(target=self.query_server.serve_forever, daemon=True)
+            server_thread.start()
+        host, port = self.query_server.server_address[:2]
+        show_message(self, "Query server running at http://" + host + ":" + str(port) + "/")
+
+    def unit_converter_callback(self, action, parameter):
+        """ Opens the unit converter window. """
+        UnitConverterWindow(self)
+
     def about_callback(self, action, parameter):
         aboutdialog = Gtk.AboutDialog()
 
@@ -826,7 +2274,7 @@ class ZeffsScrapWindow(Gtk.ApplicationWindow):
 
 class ZeffsScrapApplication(Gtk.Application):
     def __init__(self):
-        Gtk.Application.__init__(self)
+        Gtk.Application.__init__(self, application_id=APPLICATION_ID)
 
         # Create quit_action with no state
         quit_action = Gio.SimpleAction.new("quit", None)
@@ -856,6 +2304,122 @@ class ZeffsScrapApplication(Gtk.Application):
     def quit_callback(self, action, parameter):
         sys.exit()
 
-app = ZeffsScrapApplication()
-exit_status = app.run(sys.argv)
-sys.exit(exit_status)
+def run_alerts_command(args):
+    """ Lists, adds or removes price alert rules from the command line. """
+    if not os.path.isfile(DB_FILE):
+        print("Database does not exist.")
+        raise SystemExit
+    connection = sqlite3.connect(DB_FILE)
+    prepare_database(connection)
+
+    if args.action == "add":
+        try:
+            rule_id = add_alert_rule(connection, args.yard, args.material, args.rule_type,
+                                     args.value, args.long_window)
+        except ValueError as error:
+            print(error)
+            raise SystemExit(1)
+        print("Added alert rule " + str(rule_id) + ".")
+    elif args.action == "remove":
+        remove_alert_rule(connection, args.rule_id)
+        print("Removed alert rule " + str(args.rule_id) + ".")
+    else:
+        cursor = connection.execute("SELECT ID, YARD, MATERIAL, RULE_TYPE, VALUE, LONG_WINDOW FROM ALERT_RULES ORDER BY ID")
+        for rule in cursor:
+            print("{:>4}  {:<10} {:<40} {:<15} {} {}".format(*["" if item is None else item for item in rule]))
+
+    connection.close()
+
+def run_equivalents_command(args):
+    """ Lists, adds or removes material name equivalences from the command line. """
+    if not os.path.isfile(DB_FILE):
+        print("Database does not exist.")
+        raise SystemExit
+    connection = sqlite3.connect(DB_FILE)
+    prepare_database(connection)
+
+    if args.action == "add":
+        set_material_equivalent(connection, args.yard, args.material, args.canonical)
+        print(args.yard + " " + args.material + " is now compared as " + args.canonical + ".")
+    elif args.action == "remove":
+        remove_material_equivalent(connection, args.yard, args.material)
+        print("Removed common name of " + args.yard + " " + args.material + ".")
+    else:
+        cursor = connection.execute("SELECT YARD, MATERIAL, CANONICAL FROM MATERIAL_EQUIVALENTS ORDER BY CANONICAL, YARD")
+        for row in cursor:
+            print("{:<40} {:<10} {}".format(row[2], row[0], row[1]))
+
+    connection.close()
+
+def main():
+    """ Runs the application, or a headless command when one is given. """
+    parser = argparse.ArgumentParser(description="Tracks scrap metal prices.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    update_parser = subparsers.add_parser("update", help="retrieve price updates without the GUI")
+    update_parser.add_argument("yard", nargs="?", default="Zubicks", choices=sorted(YARD_URLS))
+
+    alerts_parser = subparsers.add_parser("alerts", help="manage price alert rules")
+    alerts_subparsers = alerts_parser.add_subparsers(dest="action")
+    alerts_subparsers.add_parser("list", help="list alert rules")
+    add_parser = alerts_subparsers.add_parser("add", help="add an alert rule")
+    add_parser.add_argument("material")
+    add_parser.add_argument("rule_type", choices=ALERT_RULE_TYPES)
+    add_parser.add_argument("value", nargs="?", type=float,
+                            help="threshold price, percent change or short moving average window")
+    add_parser.add_argument("--long-window", type=int, help="long moving average window")
+    add_parser.add_argument("--yard", default="Zubicks")
+    remove_parser = alerts_subparsers.add_parser("remove", help="remove an alert rule")
+    remove_parser.add_argument("rule_id", type=int)
+
+    equivalents_parser = subparsers.add_parser("equivalents", help="manage common material names used to compare yards")
+    equivalents_subparsers = equivalents_parser.add_subparsers(dest="action")
+    equivalents_subparsers.add_parser("list", help="list common material names")
+    add_parser = equivalents_subparsers.add_parser("add", help="compare a yard's material under a common name")
+    add_parser.add_argument("yard")
+    add_parser.add_argument("material")
+    add_parser.add_argument("canonical")
+    remove_parser = equivalents_subparsers.add_parser("remove", help="remove a common name mapping")
+    remove_parser.add_argument("yard")
+    remove_parser.add_argument("material")
+
+    subparsers.add_parser("scan", help="check the whole database for suspicious prices")
+
+    seal_parser = subparsers.add_parser("seal", help="move a finished year of prices into an archive file")
+    seal_parser.add_argument("year", type=int)
+
+    serve_parser = subparsers.add_parser("serve", help="run the JSON query server on localhost")
+    serve_parser.add_argument("--port", type=int, default=QUERY_SERVER_PORT)
+
+    args = parser.parse_args()
+
+    if args.command == "update":
+        fetch_price_updates(None, args.yard)
+    elif args.command == "alerts":
+        run_alerts_command(args)
+    elif args.command == "equivalents":
+        run_equivalents_command(args)
+    elif args.command == "scan":
+        checked, found = scan_database()
+        print("Checked " + str(checked) + " prices, found " + str(found) + " suspicious.")
+    elif args.command == "seal":
+        try:
+            count = seal_year(args.year)
+        except ValueError as error:
+            print(error)
+            raise SystemExit(1)
+        print("Moved " + str(count) + " prices to " + archive_file(args.year) + ".")
+    elif args.command == "serve":
+        server = create_query_server(args.port)
+        print("Serving price queries at http://" + QUERY_SERVER_HOST + ":" + str(args.port) + "/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+    else:
+        app = ZeffsScrapApplication()
+        return app.run(sys.argv[:1])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,6 +16,9 @@ sudo dnf install python3-html5lib
 sudo dnf install python3-matplotlib
 sudo dnf install python3-tkinter
 
+# Install NumPy library for price indicators
+sudo dnf install python3-numpy
+
 # Install DateUtil Library for the relativedelta routines to do date arithmetic
 sudo dnf install python3-dateutil
 
@@ -11,6 +11,8 @@ sudo apt-get install python3-html5lib
 # install matplotlib library for plotting graphs
 sudo apt-get install python3-matplotlib
 sudo apt-get install python3-tk
+# install numpy library for price indicators
+sudo apt-get install python3-numpy
 # install dateutil library for the relativedelta routines to do date arithmetic
 sudo apt-get install python3-dateutil
 sudo apt-get install libsqlite3-dev
@@ -0,0 +1,2 @@
+""" Tests for Zubick's Scrap App.  Run with python3 -m unittest from the
+installation directory. """
@@ -0,0 +1,57 @@
+""" Shared test fixtures. """
+
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import ZubicksScrapApp as zsa
+
+def price_list_page(header, prices):
+    """ Returns a price list page with header and (material, price, unit) rows. """
+    rows = "".join("<tr><td>{} </td><td>${:.2f}/{} | $0.00/kg</td></tr>".format(material, price, unit)
+                   for material, price, unit in prices)
+    return ("<html><body><h4>" + header + "</h4><table>" + rows + "</table></body></html>").encode()
+
+def updated_header(day):
+    """ Returns the "Updated" header of a page dated day. """
+    return "Updated " + zsa.MONTH_NAMES[day.month] + " " + format(day.day, '02d') + ", " + str(day.year)
+
+def fetch_page(page, yard="Zubicks"):
+    """ Runs a price update of yard from page and returns the messages printed. """
+    output = io.StringIO()
+    with mock.patch.object(zsa.urllib.request, 'urlopen', return_value=io.BytesIO(page)), \
+            contextlib.redirect_stdout(output):
+        zsa.fetch_price_updates(None, yard)
+    return output.getvalue()
+
+class TemporaryDatabaseTestCase(unittest.TestCase):
+    """ Points the application at a new database in a temporary directory. """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='zsa_test_')
+        self.saved_paths = (zsa.DB_FILE, zsa.ARCHIVE_DIR)
+        zsa.DB_FILE = os.path.join(self.directory, 'zubicksprices.db')
+        zsa.ARCHIVE_DIR = os.path.join(self.directory, 'archive') + '/'
+        zsa.create_database()
+        self.connection = sqlite3.connect(zsa.DB_FILE)
+        zsa.prepare_database(self.connection)
+        zsa.invalidate_caches()
+
+    def tearDown(self):
+        self.connection.close()
+        zsa.DB_FILE, zsa.ARCHIVE_DIR = self.saved_paths
+        zsa.invalidate_caches()
+        shutil.rmtree(self.directory)
+
+    def insert_prices(self, records):
+        """ Inserts (yard, material, price, unit, datestamp) records as an update would. """
+        self.connection.executemany("INSERT INTO PRICES (YARD, MATERIAL, PRICE, UNIT, DATESTAMP) VALUES (?,?,?,?,?)",
+                                    records)
+        zsa.update_material_index(self.connection, [record[1] for record in records])
+        zsa.update_latest_prices(self.connection, records)
+        self.connection.commit()
+        zsa.invalidate_caches()
@@ -0,0 +1,79 @@
+""" Tests of price alert rules. """
+
+import unittest
+
+import ZubicksScrapApp as zsa
+from tests.support import TemporaryDatabaseTestCase
+
+def alert_state(recent, high=None, low=None):
+    """ Returns an alert state holding the recent prices, oldest first. """
+    return {"last_price": recent[-1] if recent else None, "last_datestamp": None,
+            "high": high, "low": low, "recent": list(recent)}
+
+class CheckAlertRuleTest(unittest.TestCase):
+    def test_threshold(self):
+        state = alert_state([1.90])
+        self.assertEqual(zsa.check_alert_rule("threshold", 2.00, None, state, 2.05), "rose above $2.00")
+        self.assertIsNone(zsa.check_alert_rule("threshold", 2.00, None, state, 1.95))
+        state = alert_state([2.10])
+        self.assertEqual(zsa.check_alert_rule("threshold", 2.00, None, state, 2.00), "fell below $2.00")
+        self.assertIsNone(zsa.check_alert_rule("threshold", 2.00, None, alert_state([]), 2.05))
+
+    def test_percent_change(self):
+        state = alert_state([2.00])
+        self.assertEqual(zsa.check_alert_rule("percent_change", 10, None, state, 2.30),
+                         "changed +15.0% from $2.00")
+        self.assertEqual(zsa.check_alert_rule("percent_change", 10, None, state, 1.70),
+                         "changed -15.0% from $2.00")
+        self.assertIsNone(zsa.check_alert_rule("percent_change", 10, None, state, 2.10))
+
+    def test_ma_crossover(self):
+        state = alert_state([2.00, 2.00, 2.00, 1.90])
+        self.assertEqual(zsa.check_alert_rule("ma_crossover", 2, 4, state, 2.30),
+                         "2-point average crossed above 4-point average")
+        self.assertIsNone(zsa.check_alert_rule("ma_crossover", 2, 4, state, 1.80))
+        state = alert_state([2.00, 2.00, 2.00, 2.10])
+        self.assertEqual(zsa.check_alert_rule("ma_crossover", 2, 4, state, 1.70),
+                         "2-point average crossed below 4-point average")
+        # not enough history for the long average
+        self.assertIsNone(zsa.check_alert_rule("ma_crossover", 2, 4, alert_state([1.90, 2.00]), 3.00))
+
+    def test_new_high_and_low(self):
+        state = alert_state([2.00], high=2.50, low=1.50)
+        self.assertEqual(zsa.check_alert_rule("new_high", None, None, state, 2.60),
+                         "reached a new high (previous $2.50)")
+        self.assertEqual(zsa.check_alert_rule("new_low", None, None, state, 1.40),
+                         "reached a new low (previous $1.50)")
+        self.assertIsNone(zsa.check_alert_rule("new_high", None, None, state, 2.50))
+        self.assertIsNone(zsa.check_alert_rule("new_low", None, None, alert_state([2.00]), 1.00))
+
+class EvaluateAlertRulesTest(TemporaryDatabaseTestCase):
+    def test_alert_ids_name_the_rule(self):
+        self.insert_prices([("Zubicks", "Lead", 0.50, "lb", "2026-01-05"),
+                            ("Zubicks", "Brass", 1.50, "lb", "2026-01-05")])
+        lead_rule = zsa.add_alert_rule(self.connection, "Zubicks", "Lead", "new_high")
+        brass_rule = zsa.add_alert_rule(self.connection, "Zubicks", "Brass", "new_high")
+        alerts = []
+        for day, lead, brass in [("2026-01-12", 0.60, 1.60), ("2026-01-19", 0.70, 1.70)]:
+            records = [("Zubicks", "Lead", lead, "lb", day), ("Zubicks", "Brass", brass, "lb", day)]
+            states = zsa.load_alert_states(self.connection, records)
+            alerts.append(zsa.evaluate_alert_rules(self.connection, records, states))
+            self.connection.commit()
+
+        first_ids = [alert_id for alert_id, message in alerts[0]]
+        self.assertEqual(first_ids, ["price-alert-Zubicks-Lead-" + str(lead_rule),
+                                     "price-alert-Zubicks-Brass-" + str(brass_rule)])
+        # a later alert from the same rule reuses its id, so it replaces the earlier notification
+        self.assertEqual([alert_id for alert_id, message in alerts[1]], first_ids)
+        self.assertTrue(alerts[1][0][1].startswith("Zubicks Lead reached a new high (previous 60" + zsa.CENT_SIGN + ")"))
+
+    def test_add_alert_rule_checks_values(self):
+        with self.assertRaises(ValueError):
+            zsa.add_alert_rule(self.connection, "Zubicks", "Lead", "threshold")
+        with self.assertRaises(ValueError):
+            zsa.add_alert_rule(self.connection, "Zubicks", "Lead", "ma_crossover", 5, 3)
+        with self.assertRaises(ValueError):
+            zsa.add_alert_rule(self.connection, "Zubicks", "Lead", "unknown")
+
+if __name__ == "__main__":
+    unittest.main()
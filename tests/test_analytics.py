@@ -0,0 +1,72 @@
+""" Tests of the price indicators. """
+
+import math
+import unittest
+
+import numpy
+
+import zsa_analytics
+
+class AnalyticsTest(unittest.TestCase):
+    def tearDown(self):
+        zsa_analytics.clear_cache()
+
+    def test_daily_series_holds_prices(self):
+        grid, values = zsa_analytics.daily_series([10.0, 13.0, 14.0], [1.0, 2.0, 3.0])
+        self.assertEqual(list(grid), [10.0, 11.0, 12.0, 13.0, 14.0])
+        self.assertEqual(list(values), [1.0, 1.0, 1.0, 2.0, 3.0])
+
+    def test_moving_average(self):
+        result = zsa_analytics.moving_average(numpy.array([1.0, 2.0, 3.0, 4.0]), 2)
+        self.assertTrue(math.isnan(result[0]))
+        self.assertEqual(list(result[1:]), [1.5, 2.5, 3.5])
+        self.assertTrue(numpy.isnan(zsa_analytics.moving_average(numpy.array([1.0]), 2)).all())
+
+    def test_rolling_min_max(self):
+        low, high = zsa_analytics.rolling_min_max(numpy.array([3.0, 1.0, 4.0, 1.0, 5.0]), 3)
+        self.assertTrue(numpy.isnan(low[:2]).all() and numpy.isnan(high[:2]).all())
+        self.assertEqual(list(low[2:]), [1.0, 1.0, 1.0])
+        self.assertEqual(list(high[2:]), [4.0, 4.0, 5.0])
+
+    def test_percent_change(self):
+        result = zsa_analytics.percent_change(numpy.array([2.0, 2.5, 3.0]), 1)
+        self.assertTrue(math.isnan(result[0]))
+        self.assertAlmostEqual(result[1], 25.0)
+        self.assertAlmostEqual(result[2], 20.0)
+
+    def test_rolling_volatility(self):
+        result = zsa_analytics.rolling_volatility(numpy.full(10, 2.0), 3)
+        self.assertTrue(numpy.isnan(result[:3]).all())
+        self.assertEqual(list(result[3:]), [0.0] * 7)
+        # alternating returns of +r and -r have a standard deviation of r
+        values = numpy.exp(numpy.array([0.0, 0.1, 0.0, 0.1, 0.0]))
+        result = zsa_analytics.rolling_volatility(values, 2)
+        self.assertAlmostEqual(result[4], 0.1 * math.sqrt(365) * 100)
+
+    def test_compute_indicator(self):
+        days = [0.0, 5.0, 10.0]
+        prices = [1.0, 2.0, 3.0]
+        grid, values = zsa_analytics.compute_indicator("30 Day Average", days, prices, 5.0)
+        self.assertEqual(list(grid), [5.0, 6.0, 7.0, 8.0, 9.0, 10.0])
+        self.assertTrue(numpy.isnan(values).all())
+        grid, band = zsa_analytics.compute_indicator("90 Day Min/Max Band", days, prices, 5.0)
+        self.assertEqual(len(band), 2)
+        self.assertEqual(len(band[0]), len(grid))
+        self.assertEqual(zsa_analytics.indicator_kind("Year over Year Change"), "change")
+        with self.assertRaises(ValueError):
+            zsa_analytics.find_indicator("Bollinger Bands")
+
+    def test_cached_indicator(self):
+        days = numpy.arange(100.0)
+        prices = numpy.linspace(1.0, 2.0, 100)
+        first = zsa_analytics.cached_indicator("Lead", 50.0, 99.0, "30 Day Average", days, prices)
+        # cached results are returned without computing from the new prices
+        again = zsa_analytics.cached_indicator("Lead", 50.0, 99.0, "30 Day Average", days, prices * 2)
+        self.assertIs(again, first)
+        self.assertAlmostEqual(first[1][-1], numpy.mean(prices[70:]))
+        zsa_analytics.clear_cache()
+        fresh = zsa_analytics.cached_indicator("Lead", 50.0, 99.0, "30 Day Average", days, prices * 2)
+        self.assertAlmostEqual(fresh[1][-1], 2 * numpy.mean(prices[70:]))
+
+if __name__ == "__main__":
+    unittest.main()
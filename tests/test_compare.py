@@ -0,0 +1,73 @@
+""" Tests of the comparison of prices between yards. """
+
+import unittest
+from datetime import date
+
+import ZubicksScrapApp as zsa
+from tests.support import TemporaryDatabaseTestCase
+
+class CompareYardsTest(TemporaryDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.insert_prices([
+            ("Zubicks", "#1 Copper", 4.00, "lb", "2026-01-05"),
+            ("Zubicks", "Old Stock", 9.00, "lb", "2020-03-02"),
+            ("Zubicks", "Car Battery", 12.00, "each", "2026-01-05"),
+            ("Other", "Copper #1", 4.20, "lb", "2026-01-03"),
+            ("Other", "Car Battery", 0.30, "lb", "2026-01-03"),
+        ])
+        zsa.set_material_equivalent(self.connection, "Other", "Copper #1", "#1 Copper")
+
+    def test_best_prices_rank_common_names(self):
+        rows = zsa.query_best_prices(self.connection, "#1 Copper")
+        self.assertEqual([(row[1], row[2], row[3]) for row in rows],
+                         [(1, "Other", "Copper #1"), (2, "Zubicks", "#1 Copper")])
+
+    def test_best_prices_leave_out_materials_no_longer_listed(self):
+        self.assertEqual(zsa.query_best_prices(self.connection, "Old Stock"), [])
+
+    def test_best_prices_rank_units_separately(self):
+        rows = zsa.query_best_prices(self.connection, "Car Battery")
+        self.assertEqual([(row[1], row[2], row[5]) for row in rows],
+                         [(1, "Zubicks", "each"), (1, "Other", "lb")])
+
+    def test_spread_drops_stale_prices(self):
+        self.insert_prices([("Zubicks", "#1 Copper", 4.10, "lb", "2026-01-12"),
+                            ("Zubicks", "#1 Copper", 4.30, "lb", "2026-04-06")])
+        spread = zsa.query_price_spread(self.connection, "#1 Copper", "2026-01-01", "2026-12-31")
+        self.assertEqual([row[0] for row in spread], ["2026-01-03", "2026-01-05", "2026-01-12", "2026-04-06"])
+        self.assertEqual(spread[2][1:3], ("Other", 4.20))
+        self.assertAlmostEqual(spread[2][4], 0.10)
+        # the other yard has not updated for more than SPREAD_MAX_AGE_DAYS
+        self.assertEqual(spread[3][1:], ("Zubicks", 4.30, 4.30, 0.0))
+
+    def test_spread_uses_one_unit(self):
+        spread = zsa.query_price_spread(self.connection, "Car Battery", "2026-01-01", "2026-12-31")
+        self.assertEqual(spread, [("2026-01-03", "Other", 0.30, 0.30, 0.0)])
+        spread = zsa.query_price_spread(self.connection, "Car Battery", "2026-01-01", "2026-12-31", "each")
+        self.assertEqual(spread, [("2026-01-05", "Zubicks", 12.00, 12.00, 0.0)])
+
+    def test_spread_reads_only_partitions_in_range(self):
+        this_year = date.today().year
+        self.connection.execute("DELETE FROM PRICES")
+        self.connection.commit()
+        self.insert_prices([("Zubicks", "#1 Copper", 3.00, "lb", str(year) + "-06-01")
+                            for year in range(this_year - 3, this_year)])
+        self.insert_prices([("Zubicks", "#1 Copper", 4.00, "lb", str(this_year) + "-01-05")])
+        for year in range(this_year - 3, this_year):
+            zsa.seal_year(year)
+        statements = []
+        self.connection.set_trace_callback(statements.append)
+        spread = zsa.query_price_spread(self.connection, "#1 Copper", str(this_year) + "-01-03",
+                                        str(this_year) + "-12-31")
+        self.connection.set_trace_callback(None)
+        self.assertEqual(spread, [(str(this_year) + "-01-05", "Zubicks", 4.00, 4.00, 0.0)])
+        # only the archive of the previous year may hold prices still in effect
+        attached = [statement for statement in statements if statement.startswith("ATTACH")]
+        self.assertEqual(len(attached), 1)
+        spread = zsa.query_price_spread(self.connection, "#1 Copper", str(this_year - 1) + "-07-01",
+                                        str(this_year) + "-12-31")
+        self.assertEqual([row[2] for row in spread], [4.00])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+""" Tests of price updates read from a yard's price list page. """
+
+import unittest
+from datetime import date, timedelta
+
+import ZubicksScrapApp as zsa
+from tests.support import TemporaryDatabaseTestCase, fetch_page, price_list_page, updated_header
+
+class FetchPriceUpdatesTest(TemporaryDatabaseTestCase):
+    def seal_last_two_years(self):
+        """ Fills the two years before this one with daily prices and seals them. """
+        this_year = date.today().year
+        records = []
+        day = date(this_year - 2, 12, 1)
+        while day.year < this_year:
+            records.append(("Zubicks", "Lead", 1.00, "lb", day.isoformat()))
+            records.append(("Zubicks", "#1 Copper", 4.00, "lb", day.isoformat()))
+            day += timedelta(days=7)
+        self.insert_prices(records)
+        zsa.add_alert_rule(self.connection, "Zubicks", "Lead", "new_high")
+        zsa.seal_year(this_year - 2)
+        zsa.seal_year(this_year - 1)
+        return date(this_year, 1, 5)
+
+    def test_update_after_sealing_reads_history_from_archives(self):
+        update_day = self.seal_last_two_years()
+        output = fetch_page(price_list_page(updated_header(update_day),
+                                            [("Lead", 1.50, "lb"), ("#1 Copper", 4.00, "lb")]))
+        self.assertIn("Prices updated", output)
+        # the jump is measured against the archived prices
+        self.assertIn("Lead jump", output)
+        self.assertNotIn("#1 Copper", output)
+        # the alert state was seeded from the archived prices
+        self.assertIn("ALERT: Zubicks Lead", output)
+        row = self.connection.execute("SELECT RECENT_PRICES FROM ALERT_STATE WHERE MATERIAL='Lead'").fetchone()
+        self.assertEqual(len(row[0].split(',')), zsa.ALERT_HISTORY_LENGTH)
+        count = self.connection.execute("SELECT COUNT(*) FROM PRICES").fetchone()[0]
+        self.assertEqual(count, 2)
+
+    def test_update_in_sealed_year_is_rejected(self):
+        update_day = self.seal_last_two_years()
+        output = fetch_page(price_list_page(updated_header(date(update_day.year - 1, 12, 31)),
+                                            [("Lead", 1.00, "lb")]))
+        self.assertIn("is sealed", output)
+        self.assertEqual(self.connection.execute("SELECT COUNT(*) FROM PRICES").fetchone()[0], 0)
+
+    def test_repeated_update_is_skipped(self):
+        page = price_list_page(updated_header(date.today()), [("Lead", 1.00, "lb")])
+        self.assertIn("Prices updated", fetch_page(page))
+        self.assertIn("No prices updates available", fetch_page(page))
+        self.assertEqual(self.connection.execute("SELECT COUNT(*) FROM PRICES").fetchone()[0], 1)
+
+    def test_prices_are_stored_per_pound(self):
+        fetch_page(price_list_page(updated_header(date.today()), [("Steel", 200.00, "NT")]))
+        price, unit, original_price, original_unit = self.connection.execute(
+            "SELECT PRICE, UNIT, ORIGINAL_PRICE, ORIGINAL_UNIT FROM PRICES").fetchone()
+        self.assertAlmostEqual(price, 0.10)
+        self.assertEqual((unit, original_price, original_unit), ("lb", 200.00, "NT"))
+
+if __name__ == "__main__":
+    unittest.main()
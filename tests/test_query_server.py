@@ -0,0 +1,70 @@
+""" Tests of the JSON query service, without opening a socket. """
+
+import gzip
+import json
+import unittest
+
+import ZubicksScrapApp as zsa
+from tests.support import TemporaryDatabaseTestCase
+
+class QueryServiceTest(TemporaryDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.insert_prices([("Zubicks", "Lead", 0.50, "lb", "2026-01-05"),
+                            ("Zubicks", "Lead", 0.55, "lb", "2026-01-12")])
+        # a cache of its own, so only a data_version change can clear it
+        self.service = zsa.QueryService(zsa.DB_FILE, pool_size=1, cache=zsa.ResponseCache(16))
+
+    def tearDown(self):
+        self.service.pool.close()
+        super().tearDown()
+
+    def get(self, path, headers=None):
+        return self.service.handle(path, headers or {})
+
+    def test_json_response(self):
+        status, headers, body = self.get("/prices/range?material=Lead&unit=nt")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["Content-Type"], "application/json")
+        self.assertTrue(headers["ETag"].startswith('W/"'))
+        self.assertNotIn("Content-Encoding", headers)
+        rows = json.loads(body)
+        self.assertEqual([row["datestamp"] for row in rows], ["2026-01-05", "2026-01-12"])
+        self.assertAlmostEqual(rows[1]["price"], 1100.0)
+        self.assertEqual(rows[1]["unit"], "nt")
+
+    def test_not_modified(self):
+        status, headers, body = self.get("/prices/latest")
+        etag = headers["ETag"]
+        self.assertEqual(self.get("/prices/latest", {"If-None-Match": etag})[0], 304)
+        # weak comparison also matches the strong form of the tag, in a list
+        self.assertEqual(self.get("/prices/latest", {"If-None-Match": '"x", ' + etag[2:]})[:3:2], (304, b""))
+        self.assertEqual(self.get("/prices/latest", {"If-None-Match": 'W/"x"'})[0], 200)
+
+    def test_gzip(self):
+        status, headers, body = self.get("/prices/latest")
+        gzip_status, gzip_headers, gzip_body = self.get("/prices/latest", {"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(gzip_status, 200)
+        self.assertEqual(gzip_headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip_headers["Vary"], "Accept-Encoding")
+        self.assertEqual(gzip.decompress(gzip_body), body)
+
+    def test_bad_requests(self):
+        for path in ["/prices/range", "/prices/latest?unit=each", "/prices/rollup?material=Lead&period=fortnight"]:
+            status, headers, body = self.get(path)
+            self.assertEqual(status, 400, path)
+            self.assertIn("error", json.loads(body))
+        self.assertEqual(self.get("/prices/nothing")[0], 404)
+
+    def test_commit_invalidates_cached_responses(self):
+        status, headers, body = self.get("/prices/latest")
+        self.assertEqual(json.loads(body)[0]["price"], 0.55)
+        self.connection.execute("UPDATE LATEST_PRICES SET PRICE=0.60, DATESTAMP='2026-01-19' WHERE MATERIAL='Lead'")
+        self.connection.commit()
+        status, new_headers, body = self.get("/prices/latest", {"If-None-Match": headers["ETag"]})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_headers["ETag"], headers["ETag"])
+        self.assertEqual(json.loads(body)[0]["price"], 0.60)
+
+if __name__ == "__main__":
+    unittest.main()
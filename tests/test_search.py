@@ -0,0 +1,36 @@
+""" Tests of the material search index. """
+
+import unittest
+
+import ZubicksScrapApp as zsa
+from tests.support import TemporaryDatabaseTestCase
+
+class SearchMaterialsTest(TemporaryDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.insert_prices([("Zubicks", material, 1.00, "lb", "2026-01-05") for material in
+                            ["#1 Bright Copper", "#2 Copper", "Aluminum Cans", "Car Radiators", "Lead"]])
+
+    def test_normalize_material_name(self):
+        self.assertEqual(zsa.normalize_material_name("#1 Bright Copper"), "1 bright copper")
+        self.assertEqual(zsa.normalize_material_name("Owner's  Mix"), "owners mix")
+
+    def test_prefix_and_synonym_matches(self):
+        self.assertEqual(sorted(zsa.search_materials(self.connection, "copp")), ["#1 Bright Copper", "#2 Copper"])
+        self.assertEqual(zsa.search_materials(self.connection, "cu bright"), ["#1 Bright Copper"])
+        self.assertEqual(zsa.search_materials(self.connection, "ubc"), ["Aluminum Cans"])
+        self.assertEqual(zsa.search_materials(self.connection, "rads"), ["Car Radiators"])
+
+    def test_misspelled_words_are_corrected(self):
+        self.assertEqual(zsa.search_materials(self.connection, "raditors"), ["Car Radiators"])
+        self.assertEqual(zsa.search_materials(self.connection, "zzzz"), [])
+        self.assertEqual(zsa.search_materials(self.connection, "  "), [])
+
+    def test_limit(self):
+        materials = ["Copper Grade " + str(number) for number in range(zsa.SEARCH_RESULT_LIMIT + 10)]
+        self.insert_prices([("Zubicks", material, 1.00, "lb", "2026-01-05") for material in materials])
+        self.assertEqual(len(zsa.search_materials(self.connection, "c")), zsa.SEARCH_RESULT_LIMIT)
+        self.assertEqual(len(zsa.search_materials(self.connection, "c", limit=None)), len(materials) + 4)
+
+if __name__ == "__main__":
+    unittest.main()
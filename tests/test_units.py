@@ -0,0 +1,37 @@
+""" Tests of unit conversions. """
+
+import unittest
+
+import zsa_units
+
+class UnitsTest(unittest.TestCase):
+    def test_unit_key(self):
+        self.assertEqual(zsa_units.unit_key(" LBS "), "lb")
+        self.assertEqual(zsa_units.unit_key("NT"), "nt")
+        self.assertEqual(zsa_units.unit_key("ea"), "each")
+        self.assertIsNone(zsa_units.unit_key("gallon"))
+        self.assertIsNone(zsa_units.unit_key(None))
+
+    def test_price_factor(self):
+        self.assertAlmostEqual(zsa_units.price_factor("lb", "nt"), 2000.0)
+        self.assertAlmostEqual(zsa_units.price_factor("lb", "gt"), 2240.0)
+        self.assertAlmostEqual(zsa_units.price_factor("kg", "mt"), 1000.0)
+        self.assertEqual(zsa_units.price_factor("each", "kg"), 1.0)
+        self.assertAlmostEqual(zsa_units.convert_price(1.0, "lb", "kg"), 1 / 0.45359237)
+        self.assertAlmostEqual(zsa_units.convert_mass(2000.0, "lb", "nt"), 1.0)
+
+    def test_convert_prices_leaves_each_unchanged(self):
+        prices, units = zsa_units.convert_prices([1.0, 12.0, 200.0], ["lb", "each ", "NT"], "nt")
+        self.assertAlmostEqual(prices[0], 2000.0)
+        self.assertEqual(prices[1], 12.0)
+        self.assertAlmostEqual(prices[2], 200.0)
+        self.assertEqual(list(units), ["nt", "each", "nt"])
+
+    def test_price_label(self):
+        self.assertEqual(zsa_units.price_label(["lb", "lb"]), "Price per Pound")
+        self.assertEqual(zsa_units.price_label(["each"]), "Price per Each")
+        self.assertEqual(zsa_units.price_label(["nt", "each"]), "Price per Net Tonne / Each")
+        self.assertEqual(zsa_units.price_label([]), "Price")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+""" Tests of the checks made on ingested prices. """
+
+import unittest
+from datetime import date, timedelta
+
+import ZubicksScrapApp as zsa
+from tests.support import TemporaryDatabaseTestCase, fetch_page, price_list_page, updated_header
+
+class CheckPriceTest(unittest.TestCase):
+    def test_datestamp(self):
+        self.assertIsNone(zsa.check_datestamp("2024-02-29"))
+        self.assertIn("invalid", zsa.check_datestamp("2023-02-29"))
+        self.assertIn("invalid", zsa.check_datestamp("2026-10-5,"))
+        self.assertIn("invalid", zsa.check_datestamp(None))
+        future = (date.today() + timedelta(days=10)).isoformat()
+        self.assertIn("future", zsa.check_datestamp(future))
+
+    def test_price_record(self):
+        self.assertIsNone(zsa.check_price_record("Zubicks", "Lead", 0.50, "lb", "2024-01-02"))
+        self.assertIn("material", zsa.check_price_record("Zubicks", " ", 0.50, "lb", "2024-01-02"))
+        self.assertIn("positive", zsa.check_price_record("Zubicks", "Lead", -1.0, "lb", "2024-01-02"))
+        self.assertIn("unit", zsa.check_price_record("Zubicks", "Lead", 0.50, "furlong", "2024-01-02"))
+        self.assertIn("per pound", zsa.check_price_record("Zubicks", "Lead", 5000.0, "lb", "2024-01-02"))
+        # a high price per net tonne is a low price per pound
+        self.assertIsNone(zsa.check_price_record("Zubicks", "Steel", 5000.0, "NT", "2024-01-02"))
+
+    def test_price_change(self):
+        self.assertEqual(zsa.check_price_change([], 1.0), [])
+        steady = [1.00, 1.01, 1.00, 1.01, 1.00, 1.01]
+        self.assertEqual(zsa.check_price_change(steady, 1.02), [])
+        kinds = [kind for kind, detail in zsa.check_price_change(steady, 2.00)]
+        self.assertEqual(kinds, ["jump", "z-score"])
+        # too little history for a z-score
+        kinds = [kind for kind, detail in zsa.check_price_change([1.00, 1.00], 2.00)]
+        self.assertEqual(kinds, ["jump"])
+
+class IngestValidationTest(TemporaryDatabaseTestCase):
+    def test_unreadable_headers_are_rejected(self):
+        prices = [("Lead", 1.00, "lb")]
+        for header in ["Prices", "Updated Sept 05, 2026", "Updated on June 05, 2026"]:
+            output = fetch_page(price_list_page(header, prices))
+            self.assertIn("Price update rejected", output)
+        self.assertEqual(self.connection.execute("SELECT COUNT(*) FROM PRICES").fetchone()[0], 0)
+
+    def test_malformed_rows_are_rejected(self):
+        page = price_list_page(updated_header(date.today()), [("Lead", 1.00, "lb"), ("Tin", 1.00, "furlong")])
+        page = page.replace(b"</table>", b"<tr><td>Brass</td><td>call for price</td></tr></table>")
+        output = fetch_page(page)
+        self.assertIn("unreadable row", output)
+        self.assertIn("unknown unit", output)
+        materials = [row[0] for row in self.connection.execute("SELECT MATERIAL FROM PRICES")]
+        self.assertEqual(materials, ["Lead"])
+
+    def test_missing_materials_are_reported(self):
+        self.insert_prices([("Zubicks", "Lead", 1.00, "lb", "2026-01-05"),
+                            ("Zubicks", "Tin", 2.00, "lb", "2026-01-05")])
+        output = fetch_page(price_list_page(updated_header(date(2026, 1, 12)), [("Lead", 1.00, "lb")]))
+        self.assertIn("Tin missing", output)
+
+    def test_histories_read_across_archives(self):
+        this_year = date.today().year
+        self.insert_prices([("Zubicks", "Lead", 1.00 + day / 100, "lb", date(this_year - 1, 12, day + 1).isoformat())
+                            for day in range(15)])
+        zsa.seal_year(this_year - 1)
+        self.insert_prices([("Zubicks", "Lead", 2.00 + day / 100, "lb", date(this_year, 1, day + 1).isoformat())
+                            for day in range(10)])
+        histories = zsa.recent_price_histories(self.connection, "Zubicks", ["Lead", "Tin"],
+                                               date(this_year, 1, 9).isoformat())
+        self.assertEqual(len(histories["Lead"]), zsa.VALIDATION_HISTORY_LENGTH)
+        self.assertEqual(histories["Lead"][-1], 2.07)
+        self.assertEqual(histories["Lead"][0], 1.03)
+        self.assertEqual(histories["Tin"], [])
+
+if __name__ == "__main__":
+    unittest.main()
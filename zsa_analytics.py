@@ -0,0 +1,118 @@
+""" Zubick's Scrap App analytics.
+
+Technical indicators for price series, computed with NumPy over whole series
+at once.  Prices are step functions (a price holds until the next update), so
+series are first resampled to one value per day and every window is measured
+in days. """
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+# indicator name, kind of indicator and window in days
+INDICATORS = [
+    ("30 Day Average", "average", 30),
+    ("90 Day Average", "average", 90),
+    ("90 Day Min/Max Band", "band", 90),
+    ("30 Day Volatility", "volatility", 30),
+    ("Year over Year Change", "change", 365),
+]
+
+# days of price history needed before a range to compute every indicator
+LOOKBACK_DAYS = max(window for name, kind, window in INDICATORS)
+
+# computed indicators keyed by (material, start day, end day, indicator name)
+indicator_cache = {}
+
+def clear_cache():
+    """ Discards cached indicators, after new prices are added to the database. """
+    indicator_cache.clear()
+
+def daily_series(days, prices):
+    """ Resamples a price series to one price per day, holding each price
+    until the next update.  days must be sorted. """
+    days = numpy.asarray(days, dtype=float)
+    prices = numpy.asarray(prices, dtype=float)
+    grid = numpy.arange(numpy.floor(days[0]), numpy.floor(days[-1]) + 1)
+    index = numpy.searchsorted(days, grid, side='right') - 1
+    return grid, prices[index]
+
+def moving_average(values, window):
+    """ Returns the moving average of values over window points, using a
+    cumulative sum.  The first window - 1 points are NaN. """
+    result = numpy.full(len(values), numpy.nan)
+    if len(values) >= window:
+        cumulative = numpy.cumsum(numpy.insert(values, 0, 0.0))
+        result[window - 1:] = (cumulative[window:] - cumulative[:-window]) / window
+    return result
+
+def rolling_volatility(values, window):
+    """ Returns the annualized standard deviation of daily log returns over
+    window days, in percent, from cumulative sums of returns and squared returns. """
+    result = numpy.full(len(values), numpy.nan)
+    if len(values) > window:
+        returns = numpy.diff(numpy.log(values))
+        sums = numpy.cumsum(numpy.insert(returns, 0, 0.0))
+        squares = numpy.cumsum(numpy.insert(returns * returns, 0, 0.0))
+        window_sums = sums[window:] - sums[:-window]
+        window_squares = squares[window:] - squares[:-window]
+        variance = numpy.maximum(window_squares / window - (window_sums / window) ** 2, 0.0)
+        result[window:] = numpy.sqrt(variance * 365) * 100
+    return result
+
+def percent_change(values, lag):
+    """ Returns the percent change of each value from the value lag days before. """
+    result = numpy.full(len(values), numpy.nan)
+    if len(values) > lag:
+        result[lag:] = (values[lag:] - values[:-lag]) / values[:-lag] * 100
+    return result
+
+def rolling_min_max(values, window):
+    """ Returns the rolling minimum and maximum of values over window days,
+    using a strided sliding window view. """
+    low = numpy.full(len(values), numpy.nan)
+    high = numpy.full(len(values), numpy.nan)
+    if len(values) >= window:
+        windows = sliding_window_view(values, window)
+        low[window - 1:] = windows.min(axis=1)
+        high[window - 1:] = windows.max(axis=1)
+    return low, high
+
+def find_indicator(name):
+    """ Returns the kind and window of the named indicator. """
+    for indicator_name, kind, window in INDICATORS:
+        if indicator_name == name:
+            return kind, window
+    raise ValueError("Unknown indicator: " + name)
+
+def indicator_kind(name):
+    """ Returns the kind of the named indicator. """
+    return find_indicator(name)[0]
+
+def compute_indicator(name, days, prices, start_day):
+    """ Computes the named indicator for a price series.  Returns the days from
+    start_day onwards and the indicator values, or a (low, high) pair of value
+    arrays for bands.  Prices before start_day are only used as history. """
+    kind, window = find_indicator(name)
+
+    grid, values = daily_series(days, prices)
+    if kind == "average":
+        result = moving_average(values, window)
+    elif kind == "band":
+        result = rolling_min_max(values, window)
+    elif kind == "volatility":
+        result = rolling_volatility(values, window)
+    else:
+        result = percent_change(values, window)
+
+    visible = grid >= start_day
+    if kind == "band":
+        return grid[visible], (result[0][visible], result[1][visible])
+    return grid[visible], result[visible]
+
+def cached_indicator(material, start_day, end_day, name, days, prices):
+    """ Returns compute_indicator results for a material and date range,
+    computing them only on first use. """
+    key = (material, start_day, end_day, name)
+    if key not in indicator_cache:
+        indicator_cache[key] = compute_indicator(name, days, prices, start_day)
+    return indicator_cache[key]
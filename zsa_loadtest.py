@@ -0,0 +1,370 @@
+#! /usr/bin/python3
+""" Zubick's Scrap App ingest load test.
+
+Serves price list pages from a local fake yard server and replays a year of
+daily price updates through fetch_price_updates into a temporary database, as
+fast as the ingest path allows.  Pages are either synthetic, for any number of
+yards and materials, or recorded price list pages replayed in file name order.
+A concurrent reader runs price range queries while the updates are applied.
+
+Reports ingest throughput, update times, reader query times and lock errors,
+and the growth of the database file. """
+
+import argparse
+import contextlib
+import datetime
+import http.server
+import io
+import math
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+
+import ZubicksScrapApp as zsa
+
+FAKE_YARD_HOST = '127.0.0.1'
+DEFAULT_DAYS = 365
+DEFAULT_YARDS = 1
+DEFAULT_MATERIALS = 80
+FETCH_RETRIES = 3                   # attempts at each update before giving it up
+READER_RANGE_DAYS = 90              # days of prices read by each reader query
+READER_REFRESH_QUERIES = 100        # reader queries between rereading the latest materials
+PROGRESS_DAYS = 30                  # days between progress lines
+DAILY_VOLATILITY = 0.01             # standard deviation of daily log price changes
+NET_TONNE_EVERY = 4                 # every nth synthetic material is priced per net tonne
+
+def synthetic_yards(count):
+    """ Returns the names of count synthetic yards. """
+    return ["Test Yard " + str(number) for number in range(1, count + 1)]
+
+def synthetic_materials(count):
+    """ Returns the names and units of count synthetic materials. """
+    materials = []
+    for number in range(1, count + 1):
+        unit = 'NT' if number % NET_TONNE_EVERY == 0 else 'lb'
+        materials.append(("Test Material " + format(number, '03d'), unit))
+    return materials
+
+def format_page_date(date):
+    """ Returns a page header date such as "October 05, 2026".  Days are zero padded
+    because fetch_price_updates reads the first two characters of the day. """
+    return zsa.MONTH_NAMES[date.month] + " " + format(date.day, '02d') + ", " + str(date.year)
+
+def price_list_page(date, prices, page_size=0):
+    """ Returns a price list page in the layout of the Zubicks web site.
+    prices is a list of (material, price, unit).  The page is padded to about
+    page_size bytes. """
+    lines = ["<html><head><title>Prices</title></head><body>",
+             "<h4>Updated " + format_page_date(date) + "</h4>",
+             "<table>",
+             "<tr><th>Material</th><th>Price</th></tr>"]
+    for material, price, unit in prices:
+        price_per_kg = zsa.zsa_units.convert_price(price, unit, 'kg')
+        lines.append("<tr><td>" + material + "</td><td>$" + format(price, '.2f') + "/" + unit
+                     + " | $" + format(price_per_kg, '.2f') + "/kg</td></tr>")
+    lines.append("</table>")
+    page = "\n".join(lines)
+    # pad with markup that is not part of the price table, as on a real page
+    padding = page_size - len(page) - len("</body></html>") - len("<!--  -->")
+    if padding > 0:
+        page += "<!-- " + "x" * padding + " -->"
+    return (page + "</body></html>").encode()
+
+class SyntheticPrices:
+    """ Random walk prices for each yard and material, advanced one day at a time. """
+    def __init__(self, yards, materials, seed=0):
+        self.materials = materials
+        self.random = random.Random(seed)
+        self.prices = {}
+        for yard in yards:
+            for material, unit in materials:
+                price = self.random.uniform(0.10, 5.00)
+                if unit == 'NT':
+                    price = zsa.zsa_units.convert_price(price, 'lb', 'nt')
+                self.prices[(yard, material)] = price
+
+    def advance(self):
+        """ Moves every price one day along its random walk. """
+        for key in self.prices:
+            self.prices[key] *= math.exp(self.random.gauss(0.0, DAILY_VOLATILITY))
+
+    def page(self, yard, date, page_size=0):
+        """ Returns the price list page of yard for date. """
+        prices = [(material, self.prices[(yard, material)], unit) for material, unit in self.materials]
+        return price_list_page(date, prices, page_size)
+
+class RecordedPages:
+    """ Recorded price list pages, served one file per day in file name order. """
+    def __init__(self, directory):
+        if not os.path.isdir(directory):
+            raise ValueError("No such directory: " + directory)
+        self.files = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                            if os.path.isfile(os.path.join(directory, name)))
+        if not self.files:
+            raise ValueError("No recorded pages in " + directory)
+        self.index = 0
+
+    def advance(self):
+        """ Moves on to the next recorded page. """
+        self.index += 1
+
+    def page(self, yard, date, page_size=0):
+        """ Returns the current recorded page.  Every yard is served the same page. """
+        with open(self.files[self.index], 'rb') as page_file:
+            return page_file.read()
+
+class FakeYardRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves /YARD_NUMBER/prices/ with the current page of that yard, after
+    the configured latency, or fails at the configured error rate. """
+    def do_GET(self):
+        server = self.server
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2 or parts[1] != 'prices' or not parts[0].isdigit() \
+                or not 1 <= int(parts[0]) <= len(server.yards):
+            self.send_error(404)
+            return
+        if server.latency > 0:
+            time.sleep(server.latency)
+        with server.lock:
+            failed = server.random.random() < server.error_rate
+            if not failed:
+                body = server.pages.page(server.yards[int(parts[0]) - 1], server.date, server.page_size)
+        if failed:
+            self.send_error(503)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def create_fake_yard_server(yards, pages, latency=0.0, error_rate=0.0, page_size=0, seed=0):
+    """ Creates a fake yard server on a free localhost port serving pages,
+    a SyntheticPrices or RecordedPages, for each of yards. """
+    server = http.server.ThreadingHTTPServer((FAKE_YARD_HOST, 0), FakeYardRequestHandler)
+    server.daemon_threads = True
+    server.yards = yards
+    server.pages = pages
+    server.latency = latency
+    server.error_rate = error_rate
+    server.page_size = page_size
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    server.date = datetime.date.today()
+    return server
+
+def yard_url(server, yard_number):
+    """ Returns the price list URL of a yard on the fake yard server. """
+    host, port = server.server_address[:2]
+    return "http://" + host + ":" + str(port) + "/" + str(yard_number) + "/prices/"
+
+def percentile(values, percent):
+    """ Returns the percent percentile of values, or 0 when there are none. """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+def format_times(times):
+    """ Returns the median, 95th percentile and largest of times in milliseconds. """
+    return "p50 {:.1f} ms, p95 {:.1f} ms, max {:.1f} ms".format(
+        percentile(times, 50) * 1000, percentile(times, 95) * 1000, max(times or [0]) * 1000)
+
+class PriceReader(threading.Thread):
+    """ Runs price range queries for the materials of the latest updates
+    against the database until stopped, timing each query and counting lock errors. """
+    def __init__(self, timeout):
+        super().__init__(daemon=True)
+        self.timeout = timeout
+        self.stopped = threading.Event()
+        self.times = []
+        self.lock_errors = 0
+        self.random = random.Random(1)
+
+    def latest_materials(self, connection):
+        """ Returns the materials of the latest updates and the last datestamp. """
+        rows = connection.execute("SELECT MATERIAL, DATESTAMP FROM LATEST_PRICES").fetchall()
+        return sorted(set(row[0] for row in rows)), max([row[1] for row in rows] or [None])
+
+    def run(self):
+        connection = sqlite3.connect(zsa.DB_FILE, timeout=self.timeout)
+        queries = 0
+        materials = []
+        while not self.stopped.is_set():
+            try:
+                if not materials or queries % READER_REFRESH_QUERIES == 0:
+                    materials, end_date = self.latest_materials(connection)
+                    if not materials:
+                        time.sleep(0.01)
+                        continue
+                    end = datetime.date.fromisoformat(end_date)
+                    start_date = (end - datetime.timedelta(days=READER_RANGE_DAYS)).isoformat()
+                queries += 1
+                material = self.random.choice(materials)
+                started = time.perf_counter()
+                zsa.query_price_range(connection, material, start_date, end_date)
+            except sqlite3.OperationalError as error:
+                # the tables do not exist until the first update
+                if "locked" in str(error):
+                    self.lock_errors += 1
+                else:
+                    time.sleep(0.01)
+                continue
+            self.times.append(time.perf_counter() - started)
+        connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def database_size(database_file):
+    """ Returns the size in bytes of a database file and its journal. """
+    size = 0
+    for path in [database_file, database_file + '-journal', database_file + '-wal']:
+        if os.path.isfile(path):
+            size += os.path.getsize(path)
+    return size
+
+def fetch_update(yard):
+    """ Applies one price update of yard through fetch_price_updates, retrying
+    failed fetches.  Returns the number of failed attempts and whether the
+    update was applied, with the messages it printed. """
+    failures = 0
+    for attempt in range(FETCH_RETRIES):
+        messages = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(messages):
+                zsa.fetch_price_updates(None, yard)
+        except (urllib.error.URLError, sqlite3.OperationalError):
+            failures += 1
+            continue
+        return failures, True, messages.getvalue()
+    return failures, False, ""
+
+def run_load_test(days=DEFAULT_DAYS, yards=DEFAULT_YARDS, materials=DEFAULT_MATERIALS,
+                  latency=0.0, error_rate=0.0, page_size=0, recorded=None,
+                  reader=True, reader_timeout=5.0, keep=False):
+    """ Replays days of daily price updates for each yard into a temporary database
+    and prints throughput, reader and database size measurements. """
+    yard_names = synthetic_yards(yards)
+    material_list = synthetic_materials(materials)
+    if recorded is not None:
+        pages = RecordedPages(recorded)
+        days = len(pages.files)
+    else:
+        pages = SyntheticPrices(yard_names, material_list)
+
+    # point the application at a temporary database and the fake yard server
+    saved = (zsa.DB_FILE, zsa.ARCHIVE_DIR, dict(zsa.YARD_URLS))
+    work_dir = tempfile.mkdtemp(prefix='zsa_loadtest_')
+    zsa.DB_FILE = os.path.join(work_dir, 'zubicksprices.db')
+    zsa.ARCHIVE_DIR = os.path.join(work_dir, 'archive/')
+    server = create_fake_yard_server(yard_names, pages, latency, error_rate, page_size)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    for number, yard in enumerate(yard_names, 1):
+        zsa.YARD_URLS[yard] = yard_url(server, number)
+
+    price_reader = None
+    if reader:
+        price_reader = PriceReader(reader_timeout)
+    update_times = []
+    failures = 0
+    abandoned = 0
+    suspicious = 0
+    rows = 0
+    start_date = datetime.date.today() - datetime.timedelta(days=days - 1)
+    if recorded is not None:
+        print("Replaying {} recorded pages for {} yards into {}".format(days, yards, zsa.DB_FILE))
+    else:
+        print("Replaying {} days of updates for {} yards from {} into {}".format(
+            days, yards, start_date.isoformat(), zsa.DB_FILE))
+    try:
+        started = time.perf_counter()
+        for day in range(days):
+            date = start_date + datetime.timedelta(days=day)
+            if day > 0:
+                with server.lock:
+                    pages.advance()
+            server.date = date
+            for yard in yard_names:
+                update_started = time.perf_counter()
+                attempts_failed, applied, messages = fetch_update(yard)
+                failures += attempts_failed
+                if not applied:
+                    abandoned += 1
+                    continue
+                update_times.append(time.perf_counter() - update_started)
+                if "suspicious prices" in messages:
+                    suspicious += 1
+            # start reading once there are prices to read
+            if price_reader is not None and not price_reader.is_alive():
+                price_reader.start()
+            if (day + 1) % PROGRESS_DAYS == 0 or day + 1 == days:
+                connection = sqlite3.connect(zsa.DB_FILE)
+                rows = connection.execute("SELECT COUNT(*) FROM PRICES").fetchone()[0]
+                connection.close()
+                elapsed = time.perf_counter() - started
+                print("day {:>4}: {:>9} prices, {:>8.1f} MB, {:>8.0f} prices/s".format(
+                    day + 1, rows, database_size(zsa.DB_FILE) / 1e6, rows / elapsed))
+        elapsed = time.perf_counter() - started
+        if price_reader is not None:
+            price_reader.stop()
+    finally:
+        server.shutdown()
+        server.server_close()
+        zsa.DB_FILE, zsa.ARCHIVE_DIR = saved[0], saved[1]
+        zsa.YARD_URLS.clear()
+        zsa.YARD_URLS.update(saved[2])
+        size = database_size(os.path.join(work_dir, 'zubicksprices.db'))
+        if not keep:
+            shutil.rmtree(work_dir)
+
+    print()
+    print("Ingest:   {} prices in {:.1f} s, {:.0f} prices/s, {:.1f} updates/s".format(
+        rows, elapsed, rows / elapsed, len(update_times) / elapsed))
+    print("Updates:  " + format_times(update_times))
+    print("          {} with suspicious prices, {} failed fetches retried, {} updates abandoned".format(
+        suspicious, failures, abandoned))
+    if price_reader is not None:
+        print("Reader:   {} queries, {}, {} lock errors".format(
+            len(price_reader.times), format_times(price_reader.times), price_reader.lock_errors))
+    print("Database: {:.1f} MB, {:.0f} bytes per price".format(size / 1e6, size / max(rows, 1)))
+    if keep:
+        print("Kept " + work_dir)
+
+def main():
+    """ Runs the load test with the command line options. """
+    parser = argparse.ArgumentParser(description="Replays price updates from a fake yard server "
+                                                 "through the ingest path and measures it.")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="days of daily updates to replay")
+    parser.add_argument("--yards", type=int, default=DEFAULT_YARDS, help="number of synthetic yards")
+    parser.add_argument("--materials", type=int, default=DEFAULT_MATERIALS, help="materials on each price list")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake yard server waits before each page")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of page requests that fail")
+    parser.add_argument("--page-size", type=int, default=0, help="bytes each page is padded to")
+    parser.add_argument("--recorded", metavar="DIR", help="replay recorded price list pages from DIR, one per day")
+    parser.add_argument("--no-reader", action="store_true", help="do not run the concurrent reader")
+    parser.add_argument("--reader-timeout", type=float, default=5.0, help="seconds the reader waits for a lock")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary database")
+    args = parser.parse_args()
+
+    try:
+        run_load_test(args.days, args.yards, args.materials, args.latency, args.error_rate,
+                      args.page_size, args.recorded, not args.no_reader, args.reader_timeout, args.keep)
+    except ValueError as error:
+        print(error)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+""" Zubick's Scrap App units.
+
+A registry of the units scrap prices are quoted in, and conversions of prices
+and masses between them.  Whole columns of prices are converted with NumPy in
+one step. """
+
+import numpy
+
+# unit, name and kilograms in one unit.  Prices per "each" are per item
+# and are never converted.
+UNITS = [
+    ("lb", "Pound", 0.45359237),
+    ("kg", "Kilogram", 1.0),
+    ("nt", "Net Tonne", 907.18474),         # 2000 lb, as on the Zubicks price list
+    ("mt", "Metric Tonne", 1000.0),
+    ("gt", "Gross Ton", 1016.0469088),      # 2240 lb
+    ("each", "Each", None),
+]
+
+KILOGRAMS_PER_UNIT = dict((unit, kilograms) for unit, name, kilograms in UNITS)
+UNIT_NAMES = dict((unit, name) for unit, name, kilograms in UNITS)
+MASS_UNITS = [unit for unit, name, kilograms in UNITS if kilograms is not None]
+
+# other spellings found on price lists
+UNIT_ALIASES = {
+    "lbs": "lb",
+    "pound": "lb",
+    "kgs": "kg",
+    "ton": "nt",
+    "tonne": "mt",
+    "t": "mt",
+    "ea": "each",
+    "pc": "each",
+}
+
+def unit_key(unit_str):
+    """ Returns the registry key of a unit string such as "lb " or "NT",
+    or None when the unit is unknown. """
+    if unit_str is None:
+        return None
+    unit = unit_str.strip().lower()
+    unit = UNIT_ALIASES.get(unit, unit)
+    if unit in KILOGRAMS_PER_UNIT:
+        return unit
+    return None
+
+def is_mass_unit(unit_str):
+    """ Tests if unit_str is a unit of mass. """
+    return unit_key(unit_str) in MASS_UNITS
+
+def price_factor(from_unit, to_unit):
+    """ Returns the number to multiply a price per from_unit by to get the price
+    per to_unit, or 1 when either unit is not a unit of mass. """
+    from_unit = unit_key(from_unit)
+    to_unit = unit_key(to_unit)
+    if from_unit not in MASS_UNITS or to_unit not in MASS_UNITS:
+        return 1.0
+    return KILOGRAMS_PER_UNIT[to_unit] / KILOGRAMS_PER_UNIT[from_unit]
+
+def convert_price(price, from_unit, to_unit):
+    """ Converts a price per from_unit to a price per to_unit. """
+    return price * price_factor(from_unit, to_unit)
+
+def convert_mass(mass, from_unit, to_unit):
+    """ Converts a mass in from_unit to to_unit. """
+    return mass / price_factor(from_unit, to_unit)
+
+def convert_prices(prices, units, to_unit):
+    """ Converts a column of prices, each quoted in the matching unit of units,
+    to prices per to_unit.  Returns the converted prices and their units as
+    NumPy arrays.  Prices in units other than mass keep their price and unit. """
+    prices = numpy.asarray(prices, dtype=float)
+    units = numpy.char.lower(numpy.char.strip(numpy.asarray(units, dtype=str)))
+    distinct_units, inverse = numpy.unique(units, return_inverse=True)
+    factors = numpy.array([price_factor(unit, to_unit) for unit in distinct_units])
+    converted = numpy.array([unit_key(unit) in MASS_UNITS for unit in distinct_units])
+    new_units = numpy.where(converted[inverse], unit_key(to_unit), units)
+    return prices * factors[inverse], new_units
+
+def price_label(units):
+    """ Returns a price axis label for prices quoted in units, such as
+    "Price per Pound", or "Price per Pound / Each" when units are mixed. """
+    names = []
+    for unit in units:
+        key = unit_key(unit)
+        name = UNIT_NAMES[key] if key is not None else str(unit).strip()
+        if name not in names:
+            names.append(name)
+    if not names:
+        return "Price"
+    return "Price per " + " / ".join(names)